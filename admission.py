@@ -0,0 +1,230 @@
+import os
+import math
+import time
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to an HTTP status with Retry-After."""
+
+    def __init__(self, message: str, status_code: int = 503, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+# Reservations made active for the current task (see Reservation.active).
+_active_reservations = ContextVar("admission_reservations", default=())
+
+class Reservation:
+    """
+    A place in a controller's queue, taken when an operation is accepted ahead of running it
+    (e.g. a queued scrape job). The first acquire() for its key made while it is active uses it:
+    no new check, and no max_wait deadline, since the request was already counted against the queue.
+    """
+
+    def __init__(self, controller, key):
+        self.controller = controller
+        self.key = key
+        self.pending = True
+
+    def release(self):
+        # Gives the place back if it was never used (e.g. the job joined a scrape already running).
+        if self.pending:
+            self.pending = False
+            self.controller._unreserve(self.key)
+
+    @contextmanager
+    def active(self):
+        token = _active_reservations.set(_active_reservations.get() + (self,))
+        try:
+            yield self
+        finally:
+            _active_reservations.reset(token)
+            self.release()
+
+class AdmissionController:
+    """
+    Caps how many operations run at once, globally (limit) and per key such as an account
+    (per_key_limit). Callers over the cap wait in a FIFO queue:
+    - a key may have at most per_key_limit running and per_key_limit waiting, beyond that
+      it is rejected with 429;
+    - at most max_queue callers wait overall, beyond that they are rejected with 503;
+    - a caller still waiting after max_wait seconds is rejected with 503.
+    max_queue/max_wait of None mean unbounded (pure backpressure, never rejects).
+    reserve() holds a place for an operation that will acquire later, counted like a waiter.
+    """
+
+    def __init__(self, name: str, limit: int, per_key_limit: int = None, max_queue: int = None,
+                 max_wait: float = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.per_key_limit = per_key_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._in_flight = 0
+        self._in_flight_by_key = Counter()
+        self._waiters = deque()  # (key, future), oldest first
+        self._reserved = Counter()  # key -> reservations not used yet
+        self._waits = deque(maxlen=1000)  # recent queue wait times, for the metrics
+        self._hold_time = None  # moving average of how long a slot is held, for Retry-After
+        self.admitted = 0
+        self.rejected = Counter()  # status code -> count
+        self.timed_out = 0
+
+    def _waiting_for(self, key) -> int:
+        return sum(1 for waiter_key, future in self._waiters if waiter_key == key and not future.done())
+
+    def _can_run(self, key) -> bool:
+        return self._in_flight < self.limit and (
+            self.per_key_limit is None or self._in_flight_by_key[key] < self.per_key_limit
+        )
+
+    def retry_after(self) -> int:
+        # Seconds until a slot is likely free: queue length times average hold time, spread over the slots.
+        hold_time = self._hold_time or self.max_wait or 1
+        queued = len(self._waiters) + sum(self._reserved.values())
+        return max(1, math.ceil(hold_time * (queued + 1) / self.limit))
+
+    def _reject(self, message: str, status_code: int):
+        self.rejected[status_code] += 1
+        raise AdmissionRejected(f"{self.name}: {message}", status_code, self.retry_after())
+
+    def check(self, key=None):
+        """Raises AdmissionRejected if a new request for key would be turned away right now."""
+        if self.max_queue is None:
+            return
+        reserved = sum(self._reserved.values())
+        if self.per_key_limit is not None and (
+            self._in_flight_by_key[key] + self._waiting_for(key) + self._reserved[key] >= 2 * self.per_key_limit
+        ):
+            self._reject(f"too many requests for {key}", 429)
+        if self._in_flight + reserved >= self.limit and len(self._waiters) + reserved >= self.max_queue:
+            self._reject("queue is full", 503)
+
+    def reserve(self, key=None) -> Reservation:
+        """
+        Checks key as acquire() would and holds its place until the operation acquires (within
+        Reservation.active()) or the reservation is released. Raises AdmissionRejected when full.
+        """
+        self.check(key)
+        self._reserved[key] += 1
+        return Reservation(self, key)
+
+    def _unreserve(self, key):
+        self._reserved[key] -= 1
+        if not self._reserved[key]:
+            del self._reserved[key]
+
+    def _claim_reservation(self, key):
+        for reservation in _active_reservations.get():
+            if reservation.controller is self and reservation.key == key and reservation.pending:
+                reservation.pending = False
+                self._unreserve(key)
+                return reservation
+        return None
+
+    def _grant(self, key, future, waited: float):
+        self._in_flight += 1
+        self._in_flight_by_key[key] += 1
+        self.admitted += 1
+        self._waits.append(waited)
+        future.set_result(waited)
+
+    def _grant_waiters(self):
+        # A waiter blocked by its per-key cap does not hold up the ones behind it.
+        now = time.monotonic()
+        for waiter in list(self._waiters):
+            key, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+            elif self._can_run(key):
+                self._waiters.remove(waiter)
+                self._grant(key, future, now - future.queued_at)
+
+    async def acquire(self, key=None):
+        # A reserved operation already passed check() and waits for its turn without a deadline.
+        reserved = self._claim_reservation(key) is not None
+        if not reserved:
+            self.check(key)
+        future = asyncio.get_running_loop().create_future()
+        future.queued_at = time.monotonic()
+        self._waiters.append((key, future))
+        self._grant_waiters()
+        if future.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), None if reserved else self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done():  # granted just as the deadline passed: keep the slot
+                return
+            future.cancel()
+            self._grant_waiters()
+            self.timed_out += 1
+            self._reject(f"no slot within {self.max_wait}s", 503)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(key)
+            else:
+                future.cancel()
+                self._grant_waiters()
+            raise
+
+    def release(self, key=None, held: float = None):
+        self._in_flight -= 1
+        self._in_flight_by_key[key] -= 1
+        if not self._in_flight_by_key[key]:
+            del self._in_flight_by_key[key]
+        if held is not None:
+            self._hold_time = held if self._hold_time is None else 0.8 * self._hold_time + 0.2 * held
+        self._grant_waiters()
+
+    @asynccontextmanager
+    async def admit(self, key=None):
+        """Holds one slot for key while the block runs, waiting for it if needed."""
+        await self.acquire(key)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "limit": self.limit,
+            "per_key_limit": self.per_key_limit,
+            "in_flight": self._in_flight,
+            "queue_depth": sum(1 for _, future in self._waiters if not future.done()),
+            "reserved": sum(self._reserved.values()),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_429": self.rejected[429],
+            "rejected_503": self.rejected[503],
+            "timed_out": self.timed_out,
+            "wait_avg": round(sum(waits) / len(waits), 4) if waits else 0,
+            "wait_p95": round(waits[int(len(waits) * 0.95)], 4) if waits else 0,
+            "wait_max": round(waits[-1], 4) if waits else 0,
+        }
+
+def _optional(name: str, default: str):
+    # "" or "0" in the environment means unbounded.
+    value = os.environ.get(name, default)
+    return float(value) if value not in ("", "0") else None
+
+# Process-wide controllers (override the limits through environment variables).
+# Apify actor runs: requests over the cap queue briefly and are then turned away with 429/503.
+actor_admission = AdmissionController(
+    "actor_runs",
+    limit=int(os.environ.get("ADMIT_ACTOR_RUNS", "8")),
+    per_key_limit=int(os.environ.get("ADMIT_ACTOR_RUNS_PER_ACCOUNT", "1")),
+    max_queue=int(os.environ.get("ADMIT_QUEUE_SIZE", "32")),
+    max_wait=_optional("ADMIT_MAX_WAIT", "30"),
+)
+# Image transfers: pure backpressure, a page build waits for upload slots instead of failing.
+upload_admission = AdmissionController(
+    "uploads",
+    limit=int(os.environ.get("ADMIT_UPLOADS", "64")),
+    per_key_limit=int(os.environ.get("ADMIT_UPLOADS_PER_ACCOUNT", "16")),
+)
@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import glob
+import gzip
+import time
+import uuid
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import argparse
+import threading
+from datetime import datetime
+from posts import read_posts
+
+logger = logging.getLogger(__name__)
+
+# Retention settings (override them through environment variables).
+ARTIFACT_KEEP_PER_ACCOUNT = int(os.environ.get("ARTIFACT_KEEP_PER_ACCOUNT", "5"))
+ARTIFACT_RETENTION_INTERVAL = float(os.environ.get("ARTIFACT_RETENTION_INTERVAL", "3600"))
+
+# Siblings written next to a page by static_pages.publish_page.
+SIBLING_SUFFIXES = (".gz", ".br")
+
+def artifact_name(prefix: str, suffix: str, account: str = None) -> str:
+    """
+    Collision-free artifact name, e.g. "cms_20250217175330_3f9c2a1b_bijouboston.html".
+    The second-resolution timestamp keeps names sortable; the random part keeps two
+    artifacts written in the same second apart.
+    """
+    name = f"{prefix}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    if account:
+        name += "_" + re.sub(r"[^A-Za-z0-9._-]", "_", account)
+    return name + suffix
+
+def content_hash(path: str) -> str:
+    # Compressed snapshots are hashed by content: gzip headers carry a write time.
+    opener = gzip.open if path.endswith(".gz") else open
+    digest = hashlib.sha256()
+    with opener(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove_artifact_files(path: str):
+    for file_path in (path,) + tuple(path + suffix for suffix in SIBLING_SUFFIXES):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+class ArtifactManifest:
+    """
+    Index of the pages and snapshots we generated: (name, kind, account, created_at, content hash,
+    size, path), stored in a local SQLite file. Listing and lookup go through it instead of
+    directory scans, identical outputs are deduplicated and old artifacts are pruned.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("ARTIFACT_MANIFEST_PATH", "artifacts.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    name TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    path TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS artifacts_by_account ON artifacts (account, kind, created_at)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_by_hash ON artifacts (kind, content_hash)")
+
+    def record(self, path: str, kind: str, account: str = "unknown", dedupe: bool = True,
+               created_at: float = None) -> tuple:
+        """
+        Adds a freshly written artifact. With dedupe, an artifact identical to one we already
+        have is deleted again in favour of the existing one. Returns (path to use, deduplicated).
+        """
+        digest = content_hash(path)
+        with self._lock, self._conn:
+            if dedupe:
+                row = self._conn.execute(
+                    "SELECT path FROM artifacts WHERE kind = ? AND account = ? AND content_hash = ? AND path != ?",
+                    (kind, account, digest, path),
+                ).fetchone()
+                if row and os.path.exists(row["path"]):
+                    remove_artifact_files(path)
+                    return row["path"], True
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.basename(path), kind, account, created_at or time.time(), digest, os.path.getsize(path), path),
+            )
+        return path, False
+
+    def list(self, account: str = None, kind: str = None, limit: int = 100) -> list:
+        """Newest first."""
+        query, params = "SELECT * FROM artifacts WHERE 1 = 1", []
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(query, params).fetchall()]
+
+    def get(self, name: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM artifacts WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def latest(self, account: str, kind: str):
+        entries = self.list(account, kind, limit=1)
+        return entries[0] if entries else None
+
+    def compact(self, keep: int = None) -> dict:
+        """
+        Applies the retention policy: keeps the newest keep artifacts per (account, kind),
+        deletes the rest (with their .gz/.br siblings) and forgets entries whose file is gone.
+        """
+        keep = keep if keep is not None else ARTIFACT_KEEP_PER_ACCOUNT
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, kind, account, path FROM artifacts ORDER BY account, kind, created_at DESC"
+            ).fetchall()
+
+        expired, missing, seen = [], [], {}
+        for row in rows:
+            group = (row["account"], row["kind"])
+            seen[group] = seen.get(group, 0) + 1
+            if not os.path.exists(row["path"]):
+                missing.append(row["name"])
+            elif seen[group] > keep:
+                expired.append(row)
+
+        for row in expired:
+            remove_artifact_files(row["path"])
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM artifacts WHERE name = ?", [(name,) for name in missing + [row["name"] for row in expired]]
+            )
+        return {"deleted": len(expired), "forgotten": len(missing)}
+
+    def import_directory(self, directory: str) -> int:
+        """One-off backfill of artifacts written before the manifest existed (no dedupe)."""
+        added = 0
+        for path in sorted(glob.glob(os.path.join(directory, "cms_*.html")) +
+                           glob.glob(os.path.join(directory, "scraped_data_*.json*"))):
+            if self.get(os.path.basename(path)):
+                continue
+            kind, account = "page", "unknown"
+            if os.path.basename(path).startswith("scraped_data_"):
+                kind = "snapshot"
+                try:
+                    posts = read_posts(path, 1)
+                    account = (posts[0].owner_username or "unknown").lower() if posts else "unknown"
+                except (ValueError, OSError):
+                    pass
+            self.record(path, kind, account, dedupe=False, created_at=os.path.getmtime(path))
+            added += 1
+        return added
+
+    def close(self):
+        self._conn.close()
+
+# Process-wide manifest, opened on first use.
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> ArtifactManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = ArtifactManifest()
+        return _manifest
+
+async def run_retention(interval: float = ARTIFACT_RETENTION_INTERVAL):
+    """Background task: compacts the manifest every interval seconds (0 disables it)."""
+    if interval <= 0:
+        return
+    while True:
+        try:
+            result = await asyncio.to_thread(get_manifest().compact)
+            if result["deleted"] or result["forgotten"]:
+                logger.info("Artifact retention: %d deleted, %d forgotten", result["deleted"], result["forgotten"])
+        except Exception as e:
+            logger.error("Artifact retention failed: %s", e)
+        await asyncio.sleep(interval)
+
+if __name__ == "__main__":
+    # Usage: python artifact_manager.py [--import static nightclub/nightclub] [--keep N]
+    parser = argparse.ArgumentParser(description="Index and prune generated pages and snapshots.")
+    parser.add_argument("--import", dest="directories", nargs="*", default=[], help="Directories to backfill")
+    parser.add_argument("--keep", type=int, default=None, help="Artifacts to keep per account and kind")
+    args = parser.parse_args()
+    manifest = get_manifest()
+    for directory in args.directories:
+        print(f"Imported {manifest.import_directory(directory)} artifacts from {directory}")
+    if args.keep is not None or not args.directories:
+        print("Retention:", manifest.compact(args.keep))
+    sys.exit(0)
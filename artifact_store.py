@@ -0,0 +1,127 @@
+import os
+import shutil
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from upload_utils import get_uploader, public_url
+from static_pages import IMMUTABLE_FILES, IMMUTABLE_CACHE_CONTROL, DEFAULT_CACHE_CONTROL
+
+logger = logging.getLogger(__name__)
+
+# Background uploads of published artifacts run here.
+ARTIFACT_UPLOAD_WORKERS = int(os.environ.get("ARTIFACT_UPLOAD_WORKERS", "4"))
+
+class LocalArtifactStore:
+    """
+    Keeps artifacts in the local static folder served at /static. Only suitable for a single
+    instance: on App Runner/Vercel the disk is per-instance and ephemeral.
+    """
+
+    def __init__(self, directory: str = "static", url_prefix: str = "/static"):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def put(self, local_path: str, name: str = None) -> str:
+        name = name or os.path.basename(local_path)
+        target = os.path.join(self.directory, name)
+        if os.path.abspath(local_path) != os.path.abspath(target):
+            os.makedirs(self.directory, exist_ok=True)
+            shutil.copyfile(local_path, target)
+        return self.url(name)
+
+    def url(self, name: str) -> str:
+        return f"{self.url_prefix}/{name}"
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.directory, name))
+
+class GCSArtifactStore:
+    """
+    Keeps artifacts in a GCS bucket under prefix so every instance hands out the same links.
+    Pages are stored gzip-encoded (from their .gz sibling when present); GCS decompresses them
+    for clients that do not accept gzip. bucket may be any object with the google-cloud-storage
+    Bucket interface (blob(name) -> upload_from_filename/exists), e.g. a local fake.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = "artifacts/", bucket=None):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = bucket
+
+    @property
+    def bucket(self):
+        return self._bucket if self._bucket is not None else get_uploader().bucket(self.bucket_name)
+
+    def put(self, local_path: str, name: str = None) -> str:
+        name = name or os.path.basename(local_path)
+        blob = self.bucket.blob(self.prefix + name)
+        blob.cache_control = IMMUTABLE_CACHE_CONTROL if IMMUTABLE_FILES.match(name) else DEFAULT_CACHE_CONTROL
+        content_type = mimetypes.guess_type(name)[0]
+        source = local_path
+        if name.endswith(".html") and os.path.exists(local_path + ".gz"):
+            blob.content_encoding = "gzip"
+            source = local_path + ".gz"
+        elif name.endswith(".gz"):
+            content_type = "application/gzip"
+        blob.upload_from_filename(source, content_type=content_type)
+        return self.url(name)
+
+    def url(self, name: str) -> str:
+        return public_url(self.bucket_name, self.prefix + name)
+
+    def exists(self, name: str) -> bool:
+        return self.bucket.blob(self.prefix + name).exists()
+
+def make_artifact_store():
+    # ARTIFACT_STORE=gcs publishes to ARTIFACT_BUCKET (default GCS_BUCKET_NAME); anything else stays local.
+    if os.environ.get("ARTIFACT_STORE", "local") == "gcs":
+        bucket_name = os.environ.get("ARTIFACT_BUCKET") or os.environ.get("GCS_BUCKET_NAME")
+        if not bucket_name:
+            raise Exception("ARTIFACT_BUCKET or GCS_BUCKET_NAME must be set for ARTIFACT_STORE=gcs")
+        return GCSArtifactStore(bucket_name, os.environ.get("ARTIFACT_PREFIX", "artifacts/"))
+    return LocalArtifactStore()
+
+class ArtifactPublisher:
+    """Publishes local artifacts to a store, either right away or on a background thread pool."""
+
+    def __init__(self, store=None, workers: int = ARTIFACT_UPLOAD_WORKERS):
+        self.store = store or make_artifact_store()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def publish(self, local_path: str) -> str:
+        """Uploads local_path and returns its shared URL."""
+        return self.store.put(local_path)
+
+    def publish_in_background(self, local_path: str):
+        """Queues the upload of local_path and returns its (future) shared URL right away."""
+        future = self._executor.submit(self.store.put, local_path)
+        future.add_done_callback(lambda future: self._report(local_path, future))
+        return self.store.url(os.path.basename(local_path))
+
+    @staticmethod
+    def _report(local_path: str, future):
+        if future.exception() is not None:
+            logger.error("Error publishing %s: %s", local_path, future.exception())
+
+    def close(self):
+        # Let queued uploads finish before the process exits.
+        self._executor.shutdown(wait=True)
+
+# Process-wide publisher, created on first use.
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher() -> ArtifactPublisher:
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ArtifactPublisher()
+        return _publisher
+
+def close_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.close()
+            _publisher = None
@@ -0,0 +1,35 @@
+import sys
+import json
+import asyncio
+from main import build_batch_pages
+from generate_cms import wait_for_deferred_uploads
+from upload_utils import close_async_downloader
+
+# Usage: python batch_scrape.py urls.txt   (one Instagram URL per line)
+#        python batch_scrape.py https://www.instagram.com/club1/ https://www.instagram.com/club2/
+def read_urls(args: list) -> list:
+    urls = []
+    for arg in args:
+        if arg.startswith("http") or "instagram.com" in arg:
+            urls.append(arg)
+        else:
+            with open(arg, "r", encoding="utf-8") as f:
+                urls.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return urls
+
+async def scrape_batch(urls: list, results_limit: int = 12) -> dict:
+    try:
+        return await build_batch_pages(urls, results_limit=results_limit)
+    finally:
+        # Deferred gallery uploads are tasks on this loop, and asyncio.run cancels whatever is
+        # still pending when it returns: let them land first, as the server does on shutdown.
+        await wait_for_deferred_uploads()
+        await close_async_downloader()
+
+if __name__ == "__main__":
+    urls = read_urls(sys.argv[1:])
+    if not urls:
+        print("Usage: python batch_scrape.py urls.txt | <instagram_url> ...")
+        sys.exit(1)
+    result = asyncio.run(scrape_batch(urls))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,360 @@
+"""
+Local stand-ins for the services the scrape pipeline talks to, for bench_scrape.py:
+
+- an Apify API (actor runs, run polling, dataset items) that replays the checked-in
+  scraped_data_*.json fixtures, with media URLs rewritten to the CDN stub;
+- an image/video CDN with configurable latency and sizes;
+- a GCS JSON API endpoint (multipart and resumable uploads, object lookups) for
+  google-cloud-storage through STORAGE_EMULATOR_HOST. Uploads are counted, not stored.
+
+Usage: python bench_fakes.py [--actor-latency 2] [--cdn-latency 0.05] ...
+then point the app at them with APIFY_API_URL, STORAGE_EMULATOR_HOST and GCS_BUCKET_NAME.
+"""
+import io
+import os
+import re
+import copy
+import glob
+import gzip
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+FIXTURE_GLOBS = ("static/scraped_data_*.json", "nightclub/**/scraped_data_*.json")
+# Hosts of the Instagram CDN URLs found in the fixtures.
+CDN_HOSTS = re.compile(r"^https://[^/]*(cdninstagram\.com|fbcdn\.net)/")
+
+def load_fixtures(patterns=FIXTURE_GLOBS) -> dict:
+    """Account -> dataset items, using the largest fixture of each account."""
+    fixtures = {}
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            with open(path, encoding="utf-8") as f:
+                items = json.load(f)
+            if not items or not isinstance(items, list):
+                continue
+            account = (items[0].get("ownerUsername") or "").lower()
+            if account and len(items) > len(fixtures.get(account, [])):
+                fixtures[account] = items
+    return fixtures
+
+def account_from_url(url: str) -> str:
+    return url.rstrip("/").split("/")[-1].lower()
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+class FakeApify:
+    """
+    Apify API v2 subset used by main.py: POST /v2/actors/{actor}/runs, GET /v2/actor-runs/{id}
+    (honouring waitForFinish) and GET /v2/datasets/{id}/items. A run takes actor_latency seconds
+    and returns resultsLimit fixture items per direct URL. With fresh, every run gets new post ids
+    and media URLs, so nothing is deduplicated or already mirrored (cold runs); otherwise the
+    fixtures are replayed verbatim (warm runs).
+    """
+
+    def __init__(self, fixtures: dict, cdn_url: str, actor_latency: float = 2.0, fresh: bool = True):
+        self.fixtures = fixtures
+        self.cdn_url = cdn_url.rstrip("/")
+        self.actor_latency = actor_latency
+        self.fresh = fresh
+        self.runs = {}  # run id -> run dict
+        self.datasets = {}  # dataset id -> items
+        self.finishes = {}  # run id -> monotonic finish time
+
+    def _media_url(self, url: str, run_number: int) -> str:
+        ext = ".mp4" if ".mp4" in url else ".jpg"
+        name = hashlib.sha1(url.encode()).hexdigest()[:20]
+        if self.fresh:
+            name += f"-r{run_number}"
+        return f"{self.cdn_url}/media/{name}{ext}"
+
+    def _rewrite(self, value, run_number: int):
+        if isinstance(value, str):
+            return self._media_url(value, run_number) if CDN_HOSTS.match(value) else value
+        if isinstance(value, list):
+            return [self._rewrite(v, run_number) for v in value]
+        if isinstance(value, dict):
+            return {k: self._rewrite(v, run_number) for k, v in value.items()}
+        return value
+
+    def _items_for(self, run_input: dict, run_number: int) -> list:
+        limit = int(run_input.get("resultsLimit") or 12)
+        # Incremental scrapes only get posts newer than this ("YYYY-MM-DDTHH:MM:SS").
+        newer_than = run_input.get("onlyPostsNewerThan")
+        items = []
+        for url in run_input.get("directUrls", []):
+            fixture = self.fixtures.get(account_from_url(url))
+            if fixture is None:
+                continue
+            for item in fixture[:limit]:
+                if newer_than and (item.get("timestamp") or "")[:19] <= newer_than:
+                    continue
+                item = self._rewrite(copy.deepcopy(item), run_number)
+                item["inputUrl"] = url
+                if self.fresh:
+                    item["id"] = f"{item.get('id')}-r{run_number}"
+                items.append(item)
+        return items
+
+    def _run(self, run_id: str) -> dict:
+        run = self.runs[run_id]
+        if run["status"] == "RUNNING" and time.monotonic() >= self.finishes[run_id]:
+            run.update(status="SUCCEEDED", finishedAt=_utc_now())
+        return run
+
+    async def start_run(self, request: Request):
+        body = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        run_input = json.loads(body or b"{}")
+        run_id, dataset_id = uuid.uuid4().hex[:17], uuid.uuid4().hex[:17]
+        self.datasets[dataset_id] = self._items_for(run_input, len(self.runs))
+        self.finishes[run_id] = time.monotonic() + self.actor_latency
+        self.runs[run_id] = {
+            "id": run_id,
+            "actId": request.path_params["actor"],
+            "userId": "bench",
+            "startedAt": _utc_now(),
+            "finishedAt": None,
+            "status": "RUNNING",
+            "meta": {"origin": "API"},
+            "stats": {},
+            "options": {"build": "latest", "timeoutSecs": 3600, "memoryMbytes": 1024, "diskMbytes": 2048},
+            "buildId": "bench",
+            "defaultKeyValueStoreId": "bench",
+            "defaultDatasetId": dataset_id,
+            "defaultRequestQueueId": "bench",
+        }
+        return JSONResponse({"data": self._run(run_id)}, status_code=201)
+
+    async def get_run(self, request: Request):
+        run_id = request.path_params["run_id"]
+        if run_id not in self.runs:
+            return JSONResponse({"error": {"type": "record-not-found", "message": "Run not found"}}, status_code=404)
+        wait = float(request.query_params.get("waitForFinish") or 0)
+        remaining = self.finishes[run_id] - time.monotonic()
+        if remaining > 0 and wait > 0:
+            await asyncio.sleep(min(remaining, wait))
+        return JSONResponse({"data": self._run(run_id)})
+
+    async def list_items(self, request: Request):
+        dataset_id = request.path_params["dataset_id"]
+        if dataset_id not in self.datasets:
+            return JSONResponse({"error": {"type": "record-not-found", "message": "Dataset not found"}}, status_code=404)
+        items = self.datasets[dataset_id]
+        offset = int(request.query_params.get("offset") or 0)
+        limit = int(request.query_params.get("limit") or len(items))
+        page = items[offset:offset + limit]
+        return JSONResponse(page, headers={
+            "x-apify-pagination-total": str(len(items)),
+            "x-apify-pagination-offset": str(offset),
+            "x-apify-pagination-limit": str(limit),
+            "x-apify-pagination-count": str(len(page)),
+            "x-apify-pagination-desc": "false",
+        })
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            # apify-client 1.x calls actors "acts", later versions "actors".
+            Route("/v2/acts/{actor}/runs", self.start_run, methods=["POST"]),
+            Route("/v2/actors/{actor}/runs", self.start_run, methods=["POST"]),
+            Route("/v2/actor-runs/{run_id}", self.get_run),
+            Route("/v2/datasets/{dataset_id}/items", self.list_items),
+        ])
+
+class FakeCDN:
+    """Serves /media/<name>.jpg (a JPEG of image_size pixels) and .mp4 (video_kb of bytes) after latency seconds."""
+
+    def __init__(self, latency: float = 0.05, image_size: int = 1080, video_kb: int = 2048):
+        self.latency = latency
+        self.image = self._make_image(image_size)
+        self.video = os.urandom(video_kb * 1024)
+        self.requests = 0
+        self.bytes_sent = 0
+
+    @staticmethod
+    def _make_image(size: int) -> bytes:
+        try:
+            from PIL import Image
+        except ImportError:  # without Pillow (and so without image variants) any payload will do
+            return os.urandom(size * size // 8)
+        # Upscaled noise compresses about like a photo: ~220 KB at 1080x1080, as on the Instagram CDN.
+        image = Image.effect_noise((max(1, size // 8),) * 2, 64).convert("RGB").resize((size, size), Image.BICUBIC)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        return buffer.getvalue()
+
+    async def media(self, request: Request):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        is_video = request.path_params["name"].endswith(".mp4")
+        body = self.video if is_video else self.image
+        self.requests += 1
+        self.bytes_sent += len(body)
+        return Response(body, media_type="video/mp4" if is_video else "image/jpeg")
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/media/{name}", self.media)])
+
+class FakeGCS:
+    """
+    GCS JSON API subset used by google-cloud-storage: multipart and resumable uploads
+    (with crc32c/md5 in the response, as the client verifies them) and object lookups.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}  # (bucket, name) -> object resource
+        self.uploads = {}  # resumable upload id -> [resource, received bytes, crc32c, md5]
+        self.bytes_received = 0
+
+    def _resource(self, bucket: str, name: str, data_size: int, crc32c, md5, content_type: str) -> dict:
+        resource = {
+            "kind": "storage#object",
+            "bucket": bucket,
+            "name": name,
+            "size": str(data_size),
+            "contentType": content_type or "application/octet-stream",
+            "generation": str(time.time_ns()),
+            "crc32c": base64.b64encode(crc32c.digest()).decode(),
+            "md5Hash": base64.b64encode(md5.digest()).decode(),
+            "updated": _utc_now(),
+        }
+        self.objects[(bucket, name)] = resource
+        self.bytes_received += data_size
+        return resource
+
+    @staticmethod
+    def _checksums(data: bytes = b""):
+        import google_crc32c
+        crc32c, md5 = google_crc32c.Checksum(), hashlib.md5()
+        crc32c.update(data)
+        md5.update(data)
+        return crc32c, md5
+
+    async def upload(self, request: Request):
+        bucket = request.path_params["bucket"]
+        body = await request.body()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        upload_type = request.query_params.get("uploadType")
+        if upload_type == "multipart":
+            boundary = re.search(r'boundary="?([^";]+)"?', request.headers["content-type"]).group(1).encode()
+            parts = [part for part in body.split(b"--" + boundary) if part.strip() not in (b"", b"--")]
+            metadata = json.loads(parts[0].split(b"\r\n\r\n", 1)[1])
+            headers, data = parts[1].split(b"\r\n\r\n", 1)
+            data = data[:-2] if data.endswith(b"\r\n") else data
+            content_type = re.search(rb"content-type:\s*([^\r\n]+)", headers, re.I)
+            return JSONResponse(self._resource(
+                bucket, metadata.get("name") or request.query_params.get("name"), len(data), *self._checksums(data),
+                metadata.get("contentType") or (content_type.group(1).decode() if content_type else None),
+            ))
+        if upload_type == "resumable":
+            metadata = json.loads(body or b"{}")
+            upload_id = uuid.uuid4().hex
+            name = metadata.get("name") or request.query_params.get("name")
+            content_type = metadata.get("contentType") or request.headers.get("x-upload-content-type")
+            self.uploads[upload_id] = [(bucket, name, content_type), 0, *self._checksums()]
+            location = f"{request.url.scheme}://{request.url.netloc}{request.url.path}?uploadType=resumable&upload_id={upload_id}"
+            return Response(status_code=200, headers={"Location": location})
+        return JSONResponse({"error": {"code": 400, "message": f"uploadType {upload_type} not supported"}}, 400)
+
+    async def upload_chunk(self, request: Request):
+        upload_id = request.query_params.get("upload_id")
+        if upload_id not in self.uploads:
+            return JSONResponse({"error": {"code": 404, "message": "No such upload"}}, 404)
+        state = self.uploads[upload_id]
+        body = await request.body()
+        state[1] += len(body)
+        state[2].update(body)
+        state[3].update(body)
+        total = (request.headers.get("content-range") or "").rpartition("/")[2]
+        if total in ("", "*") or int(total) > state[1]:
+            headers = {"Range": f"bytes=0-{state[1] - 1}"} if state[1] else {}
+            return Response(status_code=308, headers=headers)
+        (bucket, name, content_type), size, crc32c, md5 = self.uploads.pop(upload_id)
+        return JSONResponse(self._resource(bucket, name, size, crc32c, md5, content_type))
+
+    async def get_object(self, request: Request):
+        resource = self.objects.get((request.path_params["bucket"], request.path_params["name"]))
+        if resource is None:
+            return JSONResponse({"error": {"code": 404, "message": "No such object"}}, 404)
+        return JSONResponse(resource)
+
+    async def list_objects(self, request: Request):
+        bucket, prefix = request.path_params["bucket"], request.query_params.get("prefix", "")
+        items = [r for (b, name), r in self.objects.items() if b == bucket and name.startswith(prefix)]
+        return JSONResponse({"kind": "storage#objects", "items": items})
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/upload/storage/v1/b/{bucket}/o", self.upload, methods=["POST"]),
+            Route("/upload/storage/v1/b/{bucket}/o", self.upload_chunk, methods=["PUT"]),
+            Route("/storage/v1/b/{bucket}/o", self.list_objects),
+            Route("/storage/v1/b/{bucket}/o/{name:path}", self.get_object),
+        ])
+
+def stats_route(cdn: FakeCDN, gcs: FakeGCS, apify: FakeApify) -> Route:
+    # GET /stats on the CDN server: what the run cost the stand-ins.
+    async def stats(request: Request):
+        return JSONResponse({
+            "actor_runs": len(apify.runs),
+            "cdn_requests": cdn.requests,
+            "cdn_bytes": cdn.bytes_sent,
+            "gcs_objects": len(gcs.objects),
+            "gcs_bytes": gcs.bytes_received,
+        })
+    return Route("/stats", stats)
+
+async def serve(host: str = "127.0.0.1", apify_port: int = 8701, cdn_port: int = 8702, gcs_port: int = 8703,
+                actor_latency: float = 2.0, cdn_latency: float = 0.05, gcs_latency: float = 0.0,
+                image_size: int = 1080, video_kb: int = 2048, fresh: bool = True, fixtures: dict = None):
+    import uvicorn
+    cdn = FakeCDN(cdn_latency, image_size, video_kb)
+    gcs = FakeGCS(gcs_latency)
+    apify = FakeApify(fixtures if fixtures is not None else load_fixtures(), f"http://{host}:{cdn_port}",
+                      actor_latency, fresh)
+    cdn_app = cdn.app()
+    cdn_app.router.routes.append(stats_route(cdn, gcs, apify))
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+        for app, port in ((apify.app(), apify_port), (cdn_app, cdn_port), (gcs.app(), gcs_port))
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--apify-port", type=int, default=8701)
+    parser.add_argument("--cdn-port", type=int, default=8702)
+    parser.add_argument("--gcs-port", type=int, default=8703)
+    parser.add_argument("--actor-latency", type=float, default=2.0, help="Seconds an actor run takes")
+    parser.add_argument("--cdn-latency", type=float, default=0.05, help="Mean seconds per CDN download")
+    parser.add_argument("--gcs-latency", type=float, default=0.0, help="Seconds per GCS upload request")
+    parser.add_argument("--image-size", type=int, default=1080, help="Width and height of the served images")
+    parser.add_argument("--video-kb", type=int, default=2048, help="Size of the served videos")
+    parser.add_argument("--warm", action="store_true",
+                        help="Replay fixtures verbatim instead of giving every run new posts and media URLs")
+
+def serve_arguments(args) -> dict:
+    return {
+        "host": args.host, "apify_port": args.apify_port, "cdn_port": args.cdn_port, "gcs_port": args.gcs_port,
+        "actor_latency": args.actor_latency, "cdn_latency": args.cdn_latency, "gcs_latency": args.gcs_latency,
+        "image_size": args.image_size, "video_kb": args.video_kb, "fresh": not args.warm,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Apify, CDN and GCS stand-ins for benchmarks.")
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"APIFY_API_URL=http://{args.host}:{args.apify_port} STORAGE_EMULATOR_HOST=http://{args.host}:{args.gcs_port}")
+    asyncio.run(serve(**serve_arguments(args)))
@@ -0,0 +1,250 @@
+"""
+End-to-end benchmark of /scrape: drives main.app (in process, through its ASGI interface) against
+the local Apify, CDN and GCS stand-ins of bench_fakes.py, which run in a child process. Every
+request submits a scrape job and follows it to completion through /jobs/{id}.
+
+Reports p50/p95/p99 latency, throughput, peak RSS and per-stage times (scrape = apify_run +
+dataset_fetch, i.e. run_apify_and_write_to_file; page = mirror_prefetch + load_json + mirror_images +
+render + publish, i.e. generate_nightclub_page) and saves them as JSON to compare across commits.
+
+Usage: python bench_scrape.py [--requests 50] [--concurrency 10] [--compare bench_results/old.json]
+(see bench_fakes.py for the stand-in settings: --actor-latency, --cdn-latency, --image-size, --warm, ...)
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime
+import bench_fakes
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Stage groups: which job stages make up each pipeline step.
+STAGE_GROUPS = {
+    "run_apify_and_write_to_file": ("apify_run", "dataset_fetch", "write_json"),
+    # mirror_prefetch: images of the page mirrored while the dataset was still streaming in.
+    "generate_nightclub_page": ("mirror_prefetch", "load_json", "mirror_images", "render", "publish"),
+    "render": ("render",),
+}
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {
+        "p50": round(pick(0.50), 4),
+        "p95": round(pick(0.95), 4),
+        "p99": round(pick(0.99), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "max": round(values[-1], 4),
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def wait_for_port(host: str, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise Exception(f"Stand-in on {host}:{port} did not start")
+
+def run_fakes(settings: dict):
+    # Child process entry point; fixtures are loaded relative to the repository.
+    os.chdir(REPO_DIR)
+    asyncio.run(bench_fakes.serve(**settings))
+
+def configure_environment(args, workdir: str):
+    """Points the app at the stand-ins and keeps all its local state in workdir."""
+    host = args.host
+    os.environ.update({
+        "APIFY_TOKEN": "bench",
+        "APIFY_API_URL": f"http://{host}:{args.apify_port}",
+        "STORAGE_EMULATOR_HOST": f"http://{host}:{args.gcs_port}",
+        "GCS_BUCKET_NAME": "bench",
+        "GCP_CREDS_SOURCE": "",
+        "MIRROR_INDEX_PATH": os.path.join(workdir, "mirror_index.sqlite3"),
+        "POST_STORE_DIR": os.path.join(workdir, "post_store"),
+        "ARTIFACT_MANIFEST_PATH": os.path.join(workdir, "artifacts.sqlite3"),
+        "ARTIFACT_STORE": "local",
+        "ARTIFACT_RETENTION_INTERVAL": "0",
+        "JOB_STORE": "memory",
+        "TEMPLATE_DIR": os.path.join(REPO_DIR, "templates"),
+        "TEMPLATE_CACHE_DIR": os.path.join(workdir, "jinja_cache"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    if not args.warm:
+        # Cold runs: every request goes through the whole pipeline.
+        os.environ.setdefault("SCRAPE_CACHE_TTL", "0")
+    # The app writes snapshots and pages to ./static.
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    os.chdir(workdir)
+
+async def scrape_once(client, instagram_url: str, poll_interval: float) -> dict:
+    submitted = time.time()
+    response = await client.post("/scrape", data={"instagram_url": instagram_url})
+    if response.status_code != 200:
+        return {"url": instagram_url, "status": response.status_code, "error": response.text[:200]}
+    job_id = re.search(r'data-job-id="([0-9a-f]+)"', response.text).group(1)
+    while True:
+        await asyncio.sleep(poll_interval)
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("done", "failed"):
+            break
+    return {
+        "url": instagram_url,
+        "status": job["status"],
+        "error": job["error"],
+        "latency": job["finished_at"] - submitted,
+        "queue_wait": job["started_at"] - submitted,
+        "stages": job["stages"],
+    }
+
+async def drive(args, accounts: list) -> dict:
+    import httpx
+    import main  # imported after configure_environment so it picks up the settings
+
+    urls = [f"https://www.instagram.com/{accounts[i % len(accounts)]}/" for i in range(args.requests)]
+    results = []
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    async def worker(client):
+        while not queue.empty():
+            results.append(await scrape_once(client, queue.get_nowait(), args.poll_interval))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            metrics_text = (await client.get("/metrics")).text
+        async with httpx.AsyncClient() as client:
+            fakes = (await client.get(f"http://{args.host}:{args.cdn_port}/stats")).json()
+    return {"results": results, "elapsed": elapsed, "rss_before": rss_before, "fakes": fakes,
+            "metrics_lines": len(metrics_text.splitlines())}
+
+def summarize(args, run: dict) -> dict:
+    results = run["results"]
+    done = [r for r in results if r["status"] == "done"]
+    stages = {}
+    for result in done:
+        for stage, seconds in result["stages"].items():
+            stages.setdefault(stage, []).append(seconds)
+    groups = {
+        group: [sum(r["stages"].get(stage, 0) for stage in members) for r in done]
+        for group, members in STAGE_GROUPS.items()
+    }
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "requests": len(results),
+        "succeeded": len(done),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "rejected": sum(1 for r in results if r["status"] in (429, 503)),
+        "errors": sorted({str(r["error"]) for r in results if r["status"] != "done"})[:10],
+        "elapsed": round(run["elapsed"], 3),
+        "throughput_rps": round(len(done) / run["elapsed"], 3) if run["elapsed"] else 0,
+        "latency": percentiles([r["latency"] for r in done]),
+        "queue_wait": percentiles([r["queue_wait"] for r in done]),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "stage_groups": {group: percentiles(values) for group, values in groups.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_load_mb": run["rss_before"],
+        "stand_ins": run["fakes"],
+    }
+
+def print_report(summary: dict, baseline: dict = None):
+    def row(name: str, current, previous=None):
+        change = ""
+        if previous:
+            change = f"{(current - previous) / previous * 100:+8.1f}%"
+        print(f"  {name:<44}{current:>16}{change}")
+
+    print(f"commit {summary['commit']}: {summary['succeeded']}/{summary['requests']} succeeded, "
+          f"{summary['failed']} failed, {summary['rejected']} rejected in {summary['elapsed']}s")
+    for error in summary["errors"]:
+        print("  error:", error)
+    previous = baseline or {}
+    row("throughput (req/s)", summary["throughput_rps"], previous.get("throughput_rps"))
+    row("peak RSS (MB)", summary["peak_rss_mb"], previous.get("peak_rss_mb"))
+    for q in ("p50", "p95", "p99"):
+        row(f"latency {q} (s)", summary["latency"].get(q, 0), previous.get("latency", {}).get(q))
+    row("job queue wait p50/p95 (s)", f"{summary['queue_wait'].get('p50', 0)}/{summary['queue_wait'].get('p95', 0)}")
+    for section in ("stage_groups", "stages"):
+        print(f" {section.replace('_', ' ')}:")
+        for name, stats in summary[section].items():
+            row(f"{name} p50/p95 (s)", f"{stats.get('p50', 0)}/{stats.get('p95', 0)}")
+    if baseline:
+        print(f"  (changes against commit {baseline.get('commit')})")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /scrape benchmark against local stand-ins.")
+    parser.add_argument("--requests", type=int, default=50, help="Scrapes to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="Scrapes in flight at once")
+    parser.add_argument("--accounts", type=int, default=0, help="Distinct accounts to cycle through (0: all fixtures)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between /jobs/{id} polls")
+    parser.add_argument("--output", help="Results file (default: bench_results/scrape_<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to show changes against")
+    bench_fakes.add_arguments(parser)
+    args = parser.parse_args()
+
+    accounts = sorted(bench_fakes.load_fixtures())
+    if args.accounts:
+        accounts = accounts[:args.accounts]
+    fakes = multiprocessing.get_context("spawn").Process(
+        target=run_fakes, args=(bench_fakes.serve_arguments(args),), daemon=True
+    )
+    fakes.start()
+    try:
+        for port in (args.apify_port, args.cdn_port, args.gcs_port):
+            wait_for_port(args.host, port)
+        with tempfile.TemporaryDirectory(prefix="bench_scrape_") as workdir:
+            sys.path.insert(0, REPO_DIR)
+            configure_environment(args, workdir)
+            run = asyncio.run(drive(args, accounts))
+            os.chdir(REPO_DIR)
+    finally:
+        fakes.terminate()
+        fakes.join()
+
+    summary = summarize(args, run)
+    output = args.output or os.path.join(
+        REPO_DIR, "bench_results", f"scrape_{datetime.now().strftime('%Y%m%d%H%M%S')}_{summary['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+    print("Results saved to", output)
+
+if __name__ == "__main__":
+    main()
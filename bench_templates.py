@@ -0,0 +1,80 @@
+"""
+Microbenchmark for page rendering: per-render cost of nightclub_template.html and cms_template.html
+with a fresh Environment per render (the old way) against the shared, precompiled one.
+
+Usage: python bench_templates.py [snapshot file] [--renders N]
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from generate_cms import load_posts, LANDING_POST_COUNT
+from page_templates import make_template_env, render_to_file, TEMPLATE_DIR
+
+def template_context(posts: list) -> dict:
+    for item in posts + [child for post in posts for child in post.child_posts]:
+        item.proxy_image = item.image_url
+    return {
+        "username": posts[0].owner_username if posts else "Instagram Account",
+        "landing_posts": posts[:LANDING_POST_COUNT],
+        "gallery_posts": posts[LANDING_POST_COUNT:],
+        "posts": posts,
+    }
+
+def per_render_ms(render, renders: int) -> float:
+    start = time.perf_counter()
+    for _ in range(renders):
+        render()
+    return (time.perf_counter() - start) / renders * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CMS template rendering.")
+    parser.add_argument("snapshot", nargs="?", help="Scraped data file (default: newest in static/)")
+    parser.add_argument("--renders", type=int, default=200, help="Renders per measurement")
+    args = parser.parse_args()
+
+    snapshot = args.snapshot or max(glob.glob("static/scraped_data_*.json*"), key=os.path.getmtime)
+    context = template_context(load_posts(snapshot))
+    print(f"Snapshot: {snapshot} ({len(context['posts'])} posts), {args.renders} renders each\n")
+
+    work_dir = tempfile.mkdtemp()
+    output = os.path.join(work_dir, "page.html")
+    cache_dir = os.path.join(work_dir, "bytecode")
+    shared_env = make_template_env(cache_dir="", auto_reload=False)
+
+    def render_fresh(name: str):
+        # What generate_nightclub_page used to do on every call.
+        env = Environment(loader=FileSystemLoader(searchpath=TEMPLATE_DIR), autoescape=select_autoescape(["html", "xml"]))
+        html = env.get_template(name).render(**context)
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(html)
+
+    def render_cold_start(name: str):
+        # A new process: empty in-memory cache, compiled code loaded from the bytecode cache.
+        env = make_template_env(cache_dir=cache_dir, auto_reload=False)
+        with open(output, "w", encoding="utf-8") as f:
+            f.writelines(env.get_template(name).generate(**context))
+
+    def render_shared(name: str):
+        with open(output, "w", encoding="utf-8") as f:
+            f.writelines(shared_env.get_template(name).generate(**context))
+
+    try:
+        print(f"{'template':<26}{'fresh env':>12}{'bytecode':>12}{'shared':>12}{'speedup':>10}")
+        for name in ("nightclub_template.html", "cms_template.html"):
+            render_cold_start(name)  # populate the bytecode cache
+            fresh = per_render_ms(lambda: render_fresh(name), args.renders)
+            cold = per_render_ms(lambda: render_cold_start(name), args.renders)
+            shared = per_render_ms(lambda: render_shared(name), args.renders)
+            print(f"{name:<26}{fresh:>10.3f}ms{cold:>10.3f}ms{shared:>10.3f}ms{fresh / shared:>9.1f}x")
+        # Also exercise the helper generate_nightclub_page uses (shared env, atomic write).
+        render_to_file("nightclub_template.html", output, **context)
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == "__main__":
+    sys.exit(main())
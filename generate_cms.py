@@ -1,83 +1,353 @@
 import os
-import json
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import asyncio
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import webbrowser
-from upload_utils import upload_image_to_gcs  # from your upload_utils.py
+from upload_utils import upload_image_to_gcs, public_url, get_uploader, get_async_downloader  # from your upload_utils.py
+from image_variants import IMAGE_VARIANTS, content_hash, upload_variants
+from mirror_index import get_mirror_index, source_hash
+from posts import read_posts
+from admission import upload_admission
+from page_templates import render_to_file
+from static_pages import publish_page
+from metrics import stage_timer
 
-def generate_nightclub_page(json_file: str, output_html: str, bucket_name: str):
-    # Load the scraped JSON data
-    with open(json_file, 'r', encoding='utf-8') as f:
-        posts = json.load(f)
-    
-    # Limit total posts to 12
-    posts = posts[:12]
+logger = logging.getLogger(__name__)
 
-    # Determine the Instagram username from the first post, if available.
-    username = posts[0].get("ownerUsername") if posts and posts[0].get("ownerUsername") else "Instagram Account"
-
-    # Process parent posts: upload the image and update the field "proxy_image"
-    for post in posts:
-        image_url = None
-        if post.get("images") and len(post["images"]) > 0:
-            image_url = post["images"][0]
-        elif post.get("displayUrl"):
-            image_url = post["displayUrl"]
-        
-        if image_url:
-            dest_blob = f"images/{post.get('id', 'unknown')}.jpg"
-            try:
-                public_url = upload_image_to_gcs(image_url, bucket_name, dest_blob)
-                post["proxy_image"] = public_url
-            except Exception as e:
-                print(f"Error uploading image for post {post.get('id')}: {e}")
-                post["proxy_image"] = image_url  # Fallback to original URL if upload fails
+# Image mirroring settings (override them through environment variables).
+MIRROR_MAX_WORKERS = int(os.environ.get("MIRROR_MAX_WORKERS", "16"))
+MIRROR_PER_HOST_LIMIT = int(os.environ.get("MIRROR_PER_HOST_LIMIT", "8"))
+MIRROR_IMAGE_TIMEOUT = float(os.environ.get("MIRROR_IMAGE_TIMEOUT", "20"))
+# Carousel/reel videos are several MB each, so mirroring them is opt-in.
+MIRROR_VIDEOS = os.environ.get("MIRROR_VIDEOS", "0") == "1"
+MIRROR_VIDEO_TIMEOUT = float(os.environ.get("MIRROR_VIDEO_TIMEOUT", "120"))
+# Below-the-fold images are rendered with their predicted GCS URL (falling back to the CDN URL
+# in the browser) and uploaded after the page is written.
+MIRROR_DEFER_BELOW_FOLD = os.environ.get("MIRROR_DEFER_BELOW_FOLD", "1") == "1"
+
+# Uploads deferred past the page build run here.
+_deferred_executor = ThreadPoolExecutor(max_workers=max(1, MIRROR_MAX_WORKERS))
+
+# The page shows at most this many posts.
+PAGE_POST_LIMIT = 12
+
+def load_posts(json_file: str, limit: int = PAGE_POST_LIMIT) -> list:
+    # Compact .jsonl.gz snapshots as well as older raw .jsonl/.json ones, projected to Post records.
+    return read_posts(json_file, limit)
+
+# The first posts are the "Latest Highlights" row; the rest form the gallery.
+LANDING_POST_COUNT = 3
+
+def render_plan(posts: list, start: int = 0) -> tuple:
+    """
+    Lists the Post/ChildPost records whose media nightclub_template.html will emit, as
+    (above_fold, below_fold). Landing posts only show their own image; gallery posts also
+    show their child posts. start is the position of posts[0] on the page.
+    """
+    above_fold, below_fold = [], []
+    for position, post in enumerate(posts, start):
+        if position >= PAGE_POST_LIMIT:
+            break
+        if position < LANDING_POST_COUNT:
+            above_fold.append(post)
         else:
-            post["proxy_image"] = None
-
-        # Process child posts (if any)
-        if post.get("childPosts") and isinstance(post["childPosts"], list):
-            for child in post["childPosts"]:
-                child_image_url = None
-                if child.get("images") and len(child["images"]) > 0:
-                    child_image_url = child["images"][0]
-                elif child.get("displayUrl"):
-                    child_image_url = child["displayUrl"]
-                if child_image_url:
-                    child_dest_blob = f"images/{child.get('id', 'unknown')}.jpg"
-                    try:
-                        child_public_url = upload_image_to_gcs(child_image_url, bucket_name, child_dest_blob)
-                        child["proxy_image"] = child_public_url
-                    except Exception as e:
-                        print(f"Error uploading image for child post {child.get('id')}: {e}")
-                        child["proxy_image"] = child_image_url
-                else:
-                    child["proxy_image"] = None
+            below_fold.append(post)
+            below_fold.extend(post.child_posts)
+    return above_fold, below_fold
+
+def set_mirrored(item, field: str, uploaded_url: str, srcset: str = None):
+    setattr(item, field, uploaded_url)
+    if field == "proxy_image":
+        item.proxy_srcset = srcset
+
+def plan_transfers(items: list, bucket_name: str, timeout: float, mirror_videos: bool, index) -> list:
+    """
+    Lists the uploads items need as (item, field, source url, destination blob, timeout).
+    Files already recorded in the mirror index are set on their item and left out.
+    """
+    transfers = []
+    for item in items:
+        if item.image_url:
+            transfers.append((item, "proxy_image", item.image_url, f"images/{item.id}.jpg", timeout))
+        else:
+            item.proxy_image = None
+        if mirror_videos and item.video_url:
+            transfers.append((item, "proxy_video", item.video_url, f"videos/{item.id}.mp4", MIRROR_VIDEO_TIMEOUT))
+
+    # Skip files that were already mirrored by an earlier scrape.
+    if index is not None:
+        remaining = []
+        for transfer in transfers:
+            item, field, url = transfer[:3]
+            mirrored = index.lookup(bucket_name, item.id, url)
+            if mirrored:
+                set_mirrored(item, field, *mirrored)
+            else:
+                remaining.append(transfer)
+        logger.debug("Mirror index: %d of %d files already mirrored", len(transfers) - len(remaining), len(transfers))
+        transfers = remaining
+    return transfers
+
+def defer_images(transfers: list, bucket_name: str) -> tuple:
+    """
+    Splits transfers into (now, deferred). Deferred images get their predicted public URL
+    right away, with the original URL as item.fallback_image until the upload lands.
+    """
+    now, deferred = [], []
+    for transfer in transfers:
+        item, field, url, dest_blob, _ = transfer
+        if field != "proxy_image":
+            now.append(transfer)
+            continue
+        item.proxy_image = public_url(bucket_name, dest_blob)
+        item.fallback_image = url
+        deferred.append(transfer)
+    return now, deferred
+
+def mirror_variants(uploader, data: bytes, bucket_name: str, item, index, timeout: float):
+    """Uploads (or reuses) the responsive variants of an image. Returns their srcset, or None."""
+    digest = content_hash(data)
+    srcset = index.lookup_variants(bucket_name, digest) if index is not None else None
+    if srcset is None:
+        try:
+            srcset = upload_variants(uploader, data, bucket_name, digest, timeout)
+        except Exception as e:
+            logger.error("Error building image variants for post %s: %s", item.id, e)
+            return None
+        if index is not None:
+            index.record_variants(bucket_name, digest, srcset)
+    return srcset
+
+def mirror_images(items: list, bucket_name: str,
+                  max_workers: int = MIRROR_MAX_WORKERS,
+                  per_host_limit: int = MIRROR_PER_HOST_LIMIT,
+                  timeout: float = MIRROR_IMAGE_TIMEOUT,
+                  mirror_videos: bool = MIRROR_VIDEOS,
+                  index=None,
+                  defer: bool = False):
+    """
+    Uploads the image of every Post/ChildPost in items to GCS concurrently and sets
+    item.proxy_image to the public URL (or the original URL if the upload fails).
+    With mirror_videos, items with a video_url also get item.proxy_video. When Pillow is
+    available, images also get resized variants and item.proxy_srcset (see image_variants.py).
+    At most per_host_limit downloads run against the same CDN host at once.
+    Files already recorded in the mirror index are reused without any transfer.
+    With defer, images get their predicted public URL (and item.fallback_image) right away
+    and are uploaded in the background instead of being waited on.
+    """
+    index = index or get_mirror_index()
+    host_limits = {}
+    host_limits_lock = threading.Lock()
+
+    def host_limit(url: str):
+        host = urlparse(url).netloc
+        with host_limits_lock:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(per_host_limit)
+            return host_limits[host]
+
+    def mirror_one(item, field: str, url: str, dest_blob: str, url_timeout: float) -> tuple:
+        # Returns (public URL, srcset of the responsive variants or None).
+        metadata = {"item-id": item.id, "source-hash": source_hash(url)}
+        if not (IMAGE_VARIANTS and field == "proxy_image"):
+            with host_limit(url):
+                return upload_image_to_gcs(url, bucket_name, dest_blob, timeout=url_timeout, metadata=metadata), None
+
+        # Variants are built from the image bytes, so images are downloaded once into memory.
+        uploader = get_uploader()
+        with host_limit(url):
+            data, content_type = uploader.download(url, url_timeout)
+        uploaded_url = uploader.upload_bytes(data, bucket_name, dest_blob, content_type, url_timeout, metadata)
+        return uploaded_url, mirror_variants(uploader, data, bucket_name, item, index, url_timeout)
+
+    transfers = plan_transfers(items, bucket_name, timeout, mirror_videos, index)
+
+    def record_deferred(item, url: str, dest_blob: str, future):
+        try:
+            uploaded_url, srcset = future.result()
+        except Exception as e:
+            logger.error("Error uploading deferred image for post %s: %s", item.id, e)
+            return
+        if index is not None:
+            index.record(bucket_name, item.id, url, dest_blob, uploaded_url, srcset)
+
+    # Deferred images: render the predicted public URL now and upload in the background.
+    if defer:
+        transfers, deferred = defer_images(transfers, bucket_name)
+        for item, field, url, dest_blob, url_timeout in deferred:
+            future = _deferred_executor.submit(mirror_one, item, field, url, dest_blob, url_timeout)
+            future.add_done_callback(
+                lambda future, item=item, url=url, dest_blob=dest_blob: record_deferred(item, url, dest_blob, future)
+            )
+
+    pending = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for item, field, url, dest_blob, url_timeout in transfers:
+            future = executor.submit(mirror_one, item, field, url, dest_blob, url_timeout)
+            pending.append((item, field, url, dest_blob, future))
 
+    for item, field, url, dest_blob, future in pending:
+        try:
+            uploaded_url, srcset = future.result()
+        except Exception as e:
+            logger.error("Error uploading %s for post %s: %s", field, item.id, e)
+            setattr(item, field, url)  # Fallback to original URL if upload fails
+            continue
+        set_mirrored(item, field, uploaded_url, srcset)
+        if index is not None:
+            index.record(bucket_name, item.id, url, dest_blob, uploaded_url, srcset)
+
+# The async pipeline shares one upload pool across all scrapes, so concurrent pages queue for
+# upload threads instead of each holding its own; downloads stay on the event loop.
+_upload_executor = ThreadPoolExecutor(max_workers=max(1, MIRROR_MAX_WORKERS))
+# Deferred async uploads still in flight (kept referenced until they finish).
+_deferred_tasks = set()
+
+async def mirror_images_async(items: list, bucket_name: str,
+                              per_host_limit: int = MIRROR_PER_HOST_LIMIT,
+                              timeout: float = MIRROR_IMAGE_TIMEOUT,
+                              mirror_videos: bool = MIRROR_VIDEOS,
+                              index=None,
+                              defer: bool = False,
+                              account: str = None):
+    """
+    Async counterpart of mirror_images for the server: images that get responsive variants are
+    downloaded on the event loop (see AsyncImageDownloader) and uploaded to GCS from the shared
+    upload pool; videos, and images when variants are off, keep the streaming upload on an upload
+    thread. Deferred uploads run as background tasks.
+    Each transfer holds an upload_admission slot for account while it runs.
+    """
+    index = index or get_mirror_index()
+    loop = asyncio.get_running_loop()
+    host_limits = {}
+
+    def host_limit(url: str):
+        host = urlparse(url).netloc
+        if host not in host_limits:
+            host_limits[host] = asyncio.Semaphore(per_host_limit)
+        return host_limits[host]
+
+    def in_upload_thread(func, *args):
+        return loop.run_in_executor(_upload_executor, partial(func, *args))
+
+    async def mirror_one(item, field: str, url: str, dest_blob: str, url_timeout: float) -> tuple:
+        async with upload_admission.admit(account):
+            return await transfer_one(item, field, url, dest_blob, url_timeout)
+
+    async def transfer_one(item, field: str, url: str, dest_blob: str, url_timeout: float) -> tuple:
+        metadata = {"item-id": item.id, "source-hash": source_hash(url)}
+        if not (IMAGE_VARIANTS and field == "proxy_image"):
+            # No variants to build: stream the file through an upload thread (UPLOAD_STREAM), so a
+            # transfer holds a chunk in memory rather than the whole file.
+            async with host_limit(url):
+                uploaded_url = await in_upload_thread(
+                    upload_image_to_gcs, url, bucket_name, dest_blob, url_timeout, metadata
+                )
+            return uploaded_url, None
+
+        # Variants are built from the image bytes, so images are downloaded once into memory.
+        async with host_limit(url):
+            data, content_type = await get_async_downloader().download(url, url_timeout)
+        uploader = get_uploader()
+        uploaded_url = await in_upload_thread(
+            uploader.upload_bytes, data, bucket_name, dest_blob, content_type, url_timeout, metadata
+        )
+        srcset = await in_upload_thread(mirror_variants, uploader, data, bucket_name, item, index, url_timeout)
+        return uploaded_url, srcset
+
+    async def mirror_now(item, field: str, url: str, dest_blob: str, url_timeout: float):
+        try:
+            uploaded_url, srcset = await mirror_one(item, field, url, dest_blob, url_timeout)
+        except Exception as e:
+            logger.error("Error uploading %s for post %s: %s", field, item.id, e)
+            setattr(item, field, url)  # Fallback to original URL if upload fails
+            return
+        set_mirrored(item, field, uploaded_url, srcset)
+        if index is not None:
+            await in_upload_thread(index.record, bucket_name, item.id, url, dest_blob, uploaded_url, srcset)
+
+    async def mirror_deferred(item, field: str, url: str, dest_blob: str, url_timeout: float):
+        try:
+            uploaded_url, srcset = await mirror_one(item, field, url, dest_blob, url_timeout)
+        except Exception as e:
+            logger.error("Error uploading deferred image for post %s: %s", item.id, e)
+            return
+        if index is not None:
+            await in_upload_thread(index.record, bucket_name, item.id, url, dest_blob, uploaded_url, srcset)
+
+    # Index lookups hit SQLite on disk, so they run off the loop as well.
+    transfers = await in_upload_thread(plan_transfers, items, bucket_name, timeout, mirror_videos, index)
+    if defer:
+        transfers, deferred = defer_images(transfers, bucket_name)
+        for transfer in deferred:
+            task = asyncio.create_task(mirror_deferred(*transfer))
+            _deferred_tasks.add(task)
+            task.add_done_callback(_deferred_tasks.discard)
+    await asyncio.gather(*(mirror_now(*transfer) for transfer in transfers))
+
+async def wait_for_deferred_uploads():
+    """Waits for the deferred async uploads still in flight (call before shutting down)."""
+    if _deferred_tasks:
+        await asyncio.gather(*_deferred_tasks, return_exceptions=True)
+
+def page_context(posts: list) -> dict:
+    # Determine the Instagram username from the first post, if available.
+    username = posts[0].owner_username if posts and posts[0].owner_username else "Instagram Account"
     # Split posts into landing_posts (first 3) and gallery_posts (the rest)
-    landing_posts = posts[:3]
-    gallery_posts = posts[3:]
-
-    # Set up the Jinja2 environment using your "templates" folder.
-    env = Environment(
-        loader=FileSystemLoader(searchpath="templates"),
-        autoescape=select_autoescape(["html", "xml"])
-    )
-    template = env.get_template("nightclub_template.html")
-
-    # Render the template passing the username and both post lists.
-    rendered_html = template.render(
-        username=username,
-        landing_posts=landing_posts,
-        gallery_posts=gallery_posts
-    )
-
-    # Write the rendered HTML to the output file.
-    with open(output_html, "w", encoding="utf-8") as f:
-        f.write(rendered_html)
+    return {
+        "username": username,
+        "landing_posts": posts[:LANDING_POST_COUNT],
+        "gallery_posts": posts[LANDING_POST_COUNT:],
+    }
+
+def generate_nightclub_page(json_file: str, output_html: str, bucket_name: str, timer=stage_timer):
+    # Load the scraped JSON data (limited to 12 posts)
+    with timer("load_json"):
+        posts = load_posts(json_file)
+
+    # Mirror only the images the template will show: the landing row before rendering,
+    # the gallery (below the fold) in the background unless deferral is off.
+    above_fold, below_fold = render_plan(posts)
+    with timer("mirror_images"):
+        mirror_images(above_fold, bucket_name)
+        mirror_images(below_fold, bucket_name, defer=MIRROR_DEFER_BELOW_FOLD)
+
+    # Render the template passing the username and both post lists, streaming it to the output file.
+    with timer("render"):
+        render_to_file("nightclub_template.html", output_html, **page_context(posts))
+
+    # Write gzip/brotli copies for the static handler to serve as-is.
+    with timer("publish"):
+        publish_page(output_html)
     
-    print("Nightclub HTML page generated:", output_html)
+    logger.info("Nightclub HTML page generated: %s", output_html)
     webbrowser.open("file://" + os.path.realpath(output_html))
 
+async def generate_nightclub_page_async(json_file: str, output_html: str, bucket_name: str, timer=stage_timer,
+                                        account: str = None):
+    """
+    Async counterpart of generate_nightclub_page for the server: image mirroring runs on the
+    event loop, file reads/writes and rendering in threads. Does not open a browser.
+    """
+    with timer("load_json"):
+        posts = await asyncio.to_thread(load_posts, json_file)
+
+    above_fold, below_fold = render_plan(posts)
+    with timer("mirror_images"):
+        await mirror_images_async(above_fold, bucket_name, account=account)
+        await mirror_images_async(below_fold, bucket_name, defer=MIRROR_DEFER_BELOW_FOLD, account=account)
+
+    with timer("render"):
+        await asyncio.to_thread(render_to_file, "nightclub_template.html", output_html, **page_context(posts))
+
+    with timer("publish"):
+        await asyncio.to_thread(publish_page, output_html)
+    logger.info("Nightclub HTML page generated: %s", output_html)
+
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     # Example usage – update the JSON filename and your bucket name accordingly.
     generate_nightclub_page("static/scraped_data_example.json", "static/nightclub_output.html", "your-gcs-bucket-name")
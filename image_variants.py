@@ -0,0 +1,60 @@
+import os
+import io
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from importlib.util import find_spec
+from startup_timing import lazy_import
+
+# Pillow is optional: without it only the original image is mirrored. It is imported on first use.
+HAVE_PILLOW = find_spec("PIL") is not None
+
+# Responsive variant settings (override them through environment variables).
+IMAGE_VARIANTS = os.environ.get("IMAGE_VARIANTS", "1") == "1" and HAVE_PILLOW
+VARIANT_WIDTHS = tuple(int(width) for width in os.environ.get("IMAGE_VARIANT_WIDTHS", "300,600,1200").split(","))
+VARIANT_FORMAT = os.environ.get("IMAGE_VARIANT_FORMAT", "webp").lower()  # "webp" or "avif"
+VARIANT_QUALITY = int(os.environ.get("IMAGE_VARIANT_QUALITY", "75"))
+
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def make_variants(data: bytes, widths: tuple = VARIANT_WIDTHS, image_format: str = VARIANT_FORMAT,
+                  quality: int = VARIANT_QUALITY) -> list:
+    """
+    Re-encodes an image at each width in widths (never upscaling: widths past the
+    original collapse into one original-size variant). Returns [(width, data)].
+    """
+    Image = lazy_import("PIL.Image")
+    variants = []
+    with Image.open(io.BytesIO(data)) as image:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        for width in sorted(set(widths)):
+            width = min(width, image.width)
+            if variants and variants[-1][0] == width:
+                break
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format=image_format.upper(), quality=quality)
+            variants.append((width, buffer.getvalue()))
+    return variants
+
+def upload_variants(uploader, data: bytes, bucket_name: str, digest: str = None, timeout: float = None) -> str:
+    """
+    Builds the variants of an image and uploads them in parallel under
+    variants/{content hash}/{width}.{format}. Returns the srcset attribute value.
+    """
+    digest = digest or content_hash(data)
+    content_type = CONTENT_TYPES.get(VARIANT_FORMAT)
+
+    def upload_one(variant: tuple) -> str:
+        width, variant_data = variant
+        name = f"variants/{digest}/{width}.{VARIANT_FORMAT}"
+        return f"{uploader.upload_bytes(variant_data, bucket_name, name, content_type, timeout)} {width}w"
+
+    variants = make_variants(data)
+    with ThreadPoolExecutor(max_workers=max(1, len(variants))) as executor:
+        return ", ".join(executor.map(upload_one, variants))
@@ -0,0 +1,206 @@
+import os
+import json
+import logging
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are kept this many seconds for /jobs/{id}, and at most this many of them.
+JOB_TTL = float(os.environ.get("JOB_TTL", "86400"))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "1000"))
+
+@dataclass
+class Job:
+    instagram_url: str = None
+    results_limit: int = 12
+    kind: str = "scrape"  # "scrape" (one account) or "batch" (instagram_urls)
+    instagram_urls: list = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued -> running -> done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    stages: dict = field(default_factory=dict)  # stage name -> seconds
+    result: dict = None
+    error: str = None
+
+    def __post_init__(self):
+        # Called with the job after each stage (not a field, so not stored): JobQueue saves it,
+        # so /jobs/{id} shows the stages done so far while the job runs.
+        self.on_stage = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times one pipeline stage (kept on the job and in the stage histogram); usable from worker threads as well."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = round(elapsed, 4)
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            if self.on_stage is not None:
+                try:
+                    self.on_stage(self)
+                except Exception as e:
+                    # Progress reporting never fails the job; its final state is saved when it ends.
+                    logger.warning("Could not save progress of job %s: %s", self.id, e)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class InMemoryJobStore:
+    """
+    Keeps jobs in a dict. Jobs are lost on restart. Finished jobs are dropped after ttl
+    seconds, and the oldest ones beyond max_finished.
+    """
+
+    def __init__(self, ttl: float = None, max_finished: int = None):
+        self.ttl = JOB_TTL if ttl is None else ttl
+        self.max_finished = JOB_MAX_FINISHED if max_finished is None else max_finished
+        self._jobs = {}
+        self._finished = OrderedDict()  # job id -> finished_at, oldest first
+
+    def save(self, job: Job):
+        self._jobs[job.id] = job
+        if job.finished_at is not None:
+            self._finished[job.id] = job.finished_at
+            self._finished.move_to_end(job.id)
+            self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at >= cutoff and len(self._finished) <= self.max_finished:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def unfinished(self) -> list:
+        return []
+
+class SQLiteJobStore:
+    """
+    Persists jobs to a SQLite file so status survives restarts and unfinished jobs are resumed.
+    Finished jobs are deleted after ttl seconds, and the oldest ones beyond max_finished.
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_finished: int = None):
+        self.ttl = JOB_TTL if ttl is None else ttl
+        self.max_finished = JOB_MAX_FINISHED if max_finished is None else max_finished
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, data TEXT NOT NULL, finished_at REAL)"
+            )
+            # Stores created before pruning have no finished_at column.
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "finished_at" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN finished_at REAL")
+                self._conn.execute("UPDATE jobs SET finished_at = json_extract(data, '$.finished_at')")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_finished_at ON jobs (finished_at)")
+
+    def save(self, job: Job):
+        data = json.dumps(job.to_dict())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, data, finished_at) VALUES (?, ?, ?, ?)",
+                (job.id, job.status, data, job.finished_at),
+            )
+            if job.finished_at is not None:
+                self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE finished_at <= (SELECT finished_at FROM jobs"
+                    " WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT 1 OFFSET ?)",
+                    (self.max_finished,),
+                )
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def unfinished(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM jobs WHERE status IN ('queued', 'running') ORDER BY rowid"
+            ).fetchall()
+        return [Job(**json.loads(row[0])) for row in rows]
+
+def make_job_store():
+    # JOB_STORE=sqlite keeps jobs in JOB_STORE_PATH; anything else keeps them in memory.
+    if os.environ.get("JOB_STORE", "memory") == "sqlite":
+        return SQLiteJobStore(os.environ.get("JOB_STORE_PATH", "jobs.sqlite3"))
+    return InMemoryJobStore()
+
+class JobQueue:
+    """
+    Runs jobs on a fixed pool of asyncio worker tasks.
+    runner is an async function taking a Job and returning its result dict.
+    """
+
+    def __init__(self, runner, store=None, workers: int = None):
+        self.runner = runner
+        self.store = store or make_job_store()
+        self.workers = workers or int(os.environ.get("JOB_WORKERS", "4"))
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def start(self):
+        # Pick up jobs that were queued or interrupted before the last shutdown.
+        for job in self.store.unfinished():
+            job.status = "queued"
+            self.store.save(job)
+            self._queue.put_nowait(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: Job) -> Job:
+        self.store.save(job)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def pending(self) -> int:
+        """Jobs submitted but not yet picked up by a worker."""
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            job.on_stage = self.store.save
+            self.store.save(job)
+            try:
+                job.result = await self.runner(job)
+                job.status = "done"
+            except Exception as e:
+                logger.error("Job %s failed: %s", job.id, e)
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                self.store.save(job)
+                self._queue.task_done()
@@ -1,78 +1,517 @@
+# Imported first so the startup report covers every import below.
+from startup_timing import startup_timer, lazy_import
 import os
-import json
+import time
+import sqlite3
 import asyncio
-from datetime import datetime
+import logging
+import threading
+from contextlib import asynccontextmanager, nullcontext
 from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
-from apify_client import ApifyClient
+startup_timer.mark("import_framework")
 
 # Import the nightclub CMS generator function
-from generate_cms import generate_nightclub_page
+from generate_cms import (
+    generate_nightclub_page_async, mirror_images_async, render_plan, wait_for_deferred_uploads, PAGE_POST_LIMIT,
+    MIRROR_DEFER_BELOW_FOLD,
+)
+from mirror_index import get_mirror_index
+from upload_utils import init_uploader, close_uploader, close_async_downloader
+from jobs import Job, JobQueue
+from scrape_cache import SingleFlightCache, normalize_instagram_url
+from post_store import PostStore, account_key
+from posts import Post, RawArchive, project_item, write_posts, open_snapshot
+from page_templates import get_template_env
+from static_pages import PrecompressedStaticFiles
+from artifact_store import get_publisher, close_publisher
+from artifact_manager import artifact_name, get_manifest, run_retention
+from admission import AdmissionRejected, actor_admission, upload_admission
+from prewarm import Prewarmer, get_tracked_accounts
+from search_index import get_search_index
+from metrics import (
+    FILE_WRITE_SECONDS, HTTP_REQUEST_SECONDS, gauge_lines, register_collector, render_metrics, stage_timer
+)
+startup_timer.mark("import_app")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    # STARTUP_MODE=lazy (for serverless cold starts) builds the uploader and Apify client on
+    # first use instead; eager builds them here so the first request does not pay for them.
+    if os.environ.get("STARTUP_MODE", "eager") != "lazy":
+        # Create the shared image uploader (pooled HTTP session + GCS client) once per process.
+        init_uploader()
+        get_apify_client()
+    # Start the background scrape workers.
+    job_queue.start()
+    # Prune old pages and snapshots in the background.
+    retention_task = asyncio.create_task(run_retention())
+    # Keep the tracked accounts' pages fresh in the background.
+    prewarm_task = asyncio.create_task(prewarmer.run())
+    # Index snapshots written before search existed (files already indexed are skipped).
+    search_backfill_task = asyncio.create_task(backfill_search_index())
+    startup_timer.record_phase("lifespan", time.perf_counter() - start)
+    logger.info("Startup timing: %s", startup_timer.report())
+    yield
+    retention_task.cancel()
+    prewarm_task.cancel()
+    search_backfill_task.cancel()
+    await asyncio.gather(prewarm_task, search_backfill_task, return_exceptions=True)
+    await job_queue.stop()
+    # Finish deferred image and artifact uploads before the clients go away.
+    await wait_for_deferred_uploads()
+    await close_async_downloader()
+    close_publisher()
+    close_uploader()
 
 # Initialize FastAPI and templates.
 # (If you still want to serve static files from a folder named "nightclub", mount that folder.)
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app = FastAPI(lifespan=lifespan)
+templates = Jinja2Templates(env=get_template_env())
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 load_dotenv()
 
+# LOG_LEVEL=DEBUG brings back the verbose pipeline output (Apify run objects, item counts, file sizes).
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO, i.e. one line per mirrored image.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 # Apify configuration: set your APIFY_TOKEN in the .env file.
 APIFY_TOKEN = os.environ.get("APIFY_TOKEN", "your_apify_token")
-print("APIFY_TOKEN:", APIFY_TOKEN)
+logger.debug("APIFY_TOKEN %s", "set" if "APIFY_TOKEN" in os.environ else "not set, using the placeholder")
+
+# Points the client at another API endpoint, e.g. the local stand-in used by bench_scrape.py.
+APIFY_API_URL = os.environ.get("APIFY_API_URL")
+
+# The async Apify client (and the apify_client package) is only loaded on first use.
+_apify_client = None
+_apify_client_lock = threading.Lock()
+
+def get_apify_client():
+    global _apify_client
+    with _apify_client_lock:
+        if _apify_client is None:
+            settings = {"api_url": APIFY_API_URL} if APIFY_API_URL else {}
+            _apify_client = lazy_import("apify_client").ApifyClientAsync(APIFY_TOKEN, **settings)
+        return _apify_client
+
+def run_data(run) -> dict:
+    # apify-client 1.x returns runs as dicts, later versions as pydantic models with camelCase aliases.
+    return run.model_dump(by_alias=True) if hasattr(run, "model_dump") else run
 
-# Create an ApifyClient instance.
-client = ApifyClient(APIFY_TOKEN)
+# Incremental mode only asks Apify for posts newer than the last one we stored for the account.
+SCRAPE_INCREMENTAL = os.environ.get("SCRAPE_INCREMENTAL", "0") == "1"
+post_store = PostStore()
 
-def run_instagram_scraper_sync(instagram_url: str, results_limit: int = 12) -> dict:
+async def run_actor(run_input: dict, account: str) -> dict:
+    # Start the run and poll for it on the event loop: a long actor run holds no thread.
+    # Runs are capped globally and per account (see admission.py); over the cap they queue or are rejected.
+    client = get_apify_client()
+    async with actor_admission.admit(account):
+        run = run_data(await client.actor("apify/instagram-scraper").start(run_input=run_input))
+        finished = await client.run(run["id"]).wait_for_finish()
+    if finished is None:
+        raise Exception(f"Apify run {run['id']} not found")
+    return run_data(finished)
+
+async def run_instagram_scraper(instagram_url: str, results_limit: int = 12, newer_than: str = None) -> dict:
     run_input = {
         "directUrls": [instagram_url],
         "resultsType": "posts",
         "resultsLimit": results_limit,
         "scrapeComments": False,
     }
-    run = client.actor("apify/instagram-scraper").call(run_input=run_input)
-    return run
+    if newer_than:
+        run_input["onlyPostsNewerThan"] = newer_than
+    return await run_actor(run_input, account_key(instagram_url))
 
-def get_dataset_items(default_dataset_id: str) -> list:
-    dataset = client.dataset(default_dataset_id)
-    items_response = dataset.list_items(limit=10000)
+async def run_instagram_scraper_batch(instagram_urls: list, results_limit: int = 12) -> dict:
+    # One actor run for every account; resultsLimit applies to each URL.
+    run_input = {
+        "directUrls": instagram_urls,
+        "resultsType": "posts",
+        "resultsLimit": results_limit,
+        "scrapeComments": False,
+    }
+    return await run_actor(run_input, "batch")
+
+def split_items_by_account(items: list) -> dict:
+    # Group a multi-URL dataset back into accounts using inputUrl (or ownerUsername).
+    groups = {}
+    for item in items:
+        if item.get("inputUrl"):
+            account = account_key(item["inputUrl"])
+        else:
+            account = (item.get("ownerUsername") or "unknown").lower()
+        groups.setdefault(account, []).append(item)
+    return groups
+
+# Datasets are read page by page so the first posts are on disk (and mirroring) before the last page lands.
+DATASET_PAGE_SIZE = int(os.environ.get("DATASET_PAGE_SIZE", "50"))
+
+async def get_dataset_page(default_dataset_id: str, offset: int, limit: int) -> list:
+    dataset = get_apify_client().dataset(default_dataset_id)
+    items_response = await dataset.list_items(offset=offset, limit=limit)
     return items_response.items
 
-# Main function to run the scraping and write the JSON file in the nightclub folder.
-async def run_apify_and_write_to_file(instagram_url: str, results_limit: int = 12) -> str:
-    # Run the actor call in a separate thread.
-    run = await asyncio.to_thread(run_instagram_scraper_sync, instagram_url, results_limit)
-    print("DEBUG: run data type:", type(run))
-    print("DEBUG: run data content:", run)
-    
+async def iterate_dataset_pages(default_dataset_id: str, page_size: int = DATASET_PAGE_SIZE):
+    offset = 0
+    while True:
+        items = await get_dataset_page(default_dataset_id, offset, page_size)
+        if not items:
+            return
+        yield items
+        offset += len(items)
+        if len(items) < page_size:
+            return
+
+def archive_page(raw_archive: RawArchive, page: list, snapshot: str = None):
+    # The raw items keep the fields the snapshot drops (hashtags, mentions, tags, location),
+    # so they are archived and indexed for /search here. Indexing never fails a scrape.
+    raw_archive.write(page)
+    search_index = get_search_index()
+    if search_index is not None:
+        try:
+            search_index.ingest_items(page, snapshot)
+        except Exception as e:
+            logger.error("Indexing %s for search failed: %s", snapshot, e)
+
+def write_dataset_page(f, raw_archive: RawArchive, page: list, snapshot: str = None) -> list:
+    # Runs in a thread so projecting, compressing and writing a page stay off the event loop.
+    archive_page(raw_archive, page, snapshot)
+    posts = [project_item(item) for item in page]
+    with FILE_WRITE_SECONDS.time(kind="snapshot"):
+        write_posts(f, posts)
+        f.flush()
+    return posts
+
+# Main function to run the scraping and stream the dataset to a compact snapshot in the static folder.
+# Snapshots hold projected posts (see posts.py) as gzip JSON Lines; on_page(posts) is called
+# with every dataset page as soon as it is written.
+async def run_apify_and_write_to_file(instagram_url: str, results_limit: int = 12, timer=stage_timer,
+                                      incremental: bool = None, on_page=None) -> str:
+    incremental = SCRAPE_INCREMENTAL if incremental is None else incremental
+    account = account_key(instagram_url)
+    newer_than = await asyncio.to_thread(post_store.newest_timestamp, account) if incremental else None
+
+    with timer("apify_run"):
+        run = await run_instagram_scraper(instagram_url, results_limit, newer_than)
+    logger.debug("Apify run: %s", run)
+
     # Extract the dataset ID from the run output.
     default_dataset_id = run.get("defaultDatasetId")
     if not default_dataset_id:
         raise HTTPException(status_code=500, detail="No dataset ID returned from Apify run")
-    
-    # Retrieve the dataset items in a thread.
-    items = await asyncio.to_thread(get_dataset_items, default_dataset_id)
-    print("DEBUG: Retrieved", len(items), "items.")
-    
-    # Save JSON output in the "nightclub" folder.
-    filename = f"scraped_data_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-    output_dir = "static"  # use this folder for output
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    filepath = os.path.join(output_dir, filename)
-    
+
+    filename = artifact_name("scraped_data", ".jsonl.gz", account)
+    raw_archive = RawArchive(filename)
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(items, f)
-        print("File written successfully to:", filepath)
-    except Exception as e:
-        print("Error writing file:", e)
-        raise HTTPException(status_code=500, detail=f"Failed to write data file: {e}")
+        posts = []
+        if incremental:
+            # Incremental runs only return the new posts: collect them and merge them with what we
+            # already have. Nothing new means the last snapshot still holds.
+            with timer("dataset_fetch"):
+                async for page in iterate_dataset_pages(default_dataset_id):
+                    await asyncio.to_thread(archive_page, raw_archive, page, filename)
+                    posts.extend(project_item(item) for item in page)
+            logger.debug("Retrieved %d items.", len(posts))
+            # The merge is only stored with the snapshot below: if writing it fails, the next
+            # run asks for the same posts again instead of skipping them.
+            merged, changed = await asyncio.to_thread(
+                post_store.merge, account, [post.to_dict() for post in posts], results_limit
+            )
+            posts = [Post.from_dict(post) for post in merged]
+            previous = (await asyncio.to_thread(post_store.load, account)).get("snapshot")
+            if not changed and previous and os.path.exists(os.path.join("static", previous)):
+                logger.info("No new posts for %s - reusing %s", account, previous)
+                return previous
+
+        # Save the snapshot in the "static" folder.
+        output_dir = "static"  # use this folder for output
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        filepath = os.path.join(output_dir, filename)
+
+        try:
+            with open_snapshot(filepath, "wt") as f:
+                if incremental:
+                    with timer("write_json"), FILE_WRITE_SECONDS.time(kind="snapshot"):
+                        await asyncio.to_thread(write_posts, f, posts)
+                    if on_page:
+                        on_page(posts)
+                else:
+                    # Stream each dataset page to disk as it arrives.
+                    count = 0
+                    with timer("dataset_fetch"):
+                        async for page in iterate_dataset_pages(default_dataset_id):
+                            posts = await asyncio.to_thread(write_dataset_page, f, raw_archive, page, filename)
+                            count += len(posts)
+                            if on_page:
+                                on_page(posts)
+                    logger.debug("Retrieved %d items.", count)
+            logger.debug("File written successfully to: %s", filepath)
+        except OSError as e:
+            logger.error("Error writing file: %s", e)
+            raise HTTPException(status_code=500, detail=f"Failed to write data file: {e}")
+    finally:
+        raw_archive.close()
+    # A snapshot identical to one we already have is dropped in favour of that one (and its page).
+    filepath, duplicate = await asyncio.to_thread(get_manifest().record, filepath, "snapshot", account)
+    filename = os.path.basename(filepath)
+    if not duplicate:
+        # Share the snapshot with other instances; nothing here waits for the upload.
+        get_publisher().publish_in_background(filepath)
+    if incremental:
+        await asyncio.to_thread(post_store.set_snapshot, account, filename, merged)
     return filename
 
+# Concurrent scrapes of the same account share one actor run, and finished datasets/pages
+# are reused for SCRAPE_CACHE_TTL seconds.
+dataset_cache = SingleFlightCache()
+page_cache = SingleFlightCache()
+
+async def scrape_to_file(instagram_url: str, results_limit: int = 12, timer=stage_timer, on_page=None,
+                         incremental: bool = None) -> str:
+    key = (normalize_instagram_url(instagram_url), results_limit)
+    return await dataset_cache.get_or_run(
+        key, lambda: run_apify_and_write_to_file(
+            instagram_url, results_limit, timer=timer, incremental=incremental, on_page=on_page
+        )
+    )
+
+async def build_cms_page(instagram_url: str, results_limit: int = 12, timer=stage_timer,
+                         incremental: bool = None) -> dict:
+    bucket_name = os.environ.get("GCS_BUCKET_NAME")
+    if not bucket_name:
+        raise Exception("GCS_BUCKET_NAME not set in environment")
+
+    # Start mirroring the images the page waits on while later dataset pages are still loading.
+    # The mirror index records the uploads, so the page build below reuses them. Deferred
+    # below-the-fold images are left to the page build, which uploads them after rendering.
+    prefetch_tasks = []
+    prefetched = 0
+
+    def prefetch_images(posts: list):
+        nonlocal prefetched
+        posts = posts[:PAGE_POST_LIMIT - prefetched]
+        if posts and get_mirror_index() is not None:
+            above_fold, below_fold = render_plan(posts, start=prefetched)
+            prefetched += len(posts)
+            items = above_fold if MIRROR_DEFER_BELOW_FOLD else above_fold + below_fold
+            if items:
+                prefetch_tasks.append(asyncio.create_task(
+                    mirror_images_async(items, bucket_name, account=account_key(instagram_url))
+                ))
+
+    try:
+        filename = await scrape_to_file(
+            instagram_url, results_limit, timer=timer, on_page=prefetch_images, incremental=incremental
+        )
+    finally:
+        with timer("mirror_prefetch"):
+            await asyncio.gather(*prefetch_tasks, return_exceptions=True)
+
+    # Path to the JSON file in the static folder.
+    json_file = os.path.join("static", filename)
+    account = account_key(instagram_url)
+
+    # An unchanged snapshot (incremental mode) keeps the page that was built from it.
+    cms_output = await asyncio.to_thread(post_store.page_for, account, filename)
+    if cms_output is None:
+        # Generate a CMS HTML file also in the static folder.
+        cms_output = os.path.join("static", artifact_name("cms", ".html", account))
+
+        # Call the nightclub CMS generator.
+        await generate_nightclub_page_async(json_file, cms_output, bucket_name, timer, account=account)
+        cms_output, _ = await asyncio.to_thread(get_manifest().record, cms_output, "page", account)
+        # The link is handed out once the page is in the shared store.
+        with timer("publish_page"):
+            await asyncio.to_thread(get_publisher().publish, cms_output)
+        await asyncio.to_thread(post_store.set_page, account, filename, cms_output)
+
+    file_size = os.path.getsize(json_file)
+    logger.debug("File %s size: %d bytes", filename, file_size)
+    return {
+        "download_link": get_publisher().store.url(os.path.basename(cms_output)),
+        "total_items": file_size,
+    }
+
+# Batch scraping: one actor run for many accounts, then one CMS page per account in parallel.
+BATCH_PAGE_CONCURRENCY = int(os.environ.get("BATCH_PAGE_CONCURRENCY", "4"))
+
+async def run_batch_and_write_files(instagram_urls: list, results_limit: int = 12, timer=stage_timer) -> dict:
+    with timer("apify_run"):
+        run = await run_instagram_scraper_batch(instagram_urls, results_limit)
+    default_dataset_id = run.get("defaultDatasetId")
+    if not default_dataset_id:
+        raise Exception("No dataset ID returned from Apify run")
+
+    # Stream each dataset page into one compact snapshot per account in the static folder.
+    filenames, files = {}, {}
+    raw_archive = RawArchive(artifact_name("scraped_data", ".jsonl.gz", "batch"))
+    count = 0
+    try:
+        with timer("dataset_fetch"):
+            async for page in iterate_dataset_pages(default_dataset_id):
+                await asyncio.to_thread(archive_page, raw_archive, page)
+                for account, account_items in split_items_by_account(page).items():
+                    if account not in files:
+                        filenames[account] = artifact_name("scraped_data", ".jsonl.gz", account)
+                        files[account] = open_snapshot(os.path.join("static", filenames[account]), "wt")
+                    with FILE_WRITE_SECONDS.time(kind="snapshot"):
+                        await asyncio.to_thread(
+                            write_posts, files[account], [project_item(item) for item in account_items]
+                        )
+                count += len(page)
+    finally:
+        raw_archive.close()
+        for f in files.values():
+            f.close()
+    for account, filename in filenames.items():
+        filepath, duplicate = await asyncio.to_thread(
+            get_manifest().record, os.path.join("static", filename), "snapshot", account
+        )
+        filenames[account] = os.path.basename(filepath)
+        if not duplicate:
+            get_publisher().publish_in_background(filepath)
+    logger.debug("Retrieved %d items for %d accounts.", count, len(instagram_urls))
+    return filenames
+
+async def build_batch_pages(instagram_urls: list, results_limit: int = 12, timer=stage_timer) -> dict:
+    bucket_name = os.environ.get("GCS_BUCKET_NAME")
+    if not bucket_name:
+        raise Exception("GCS_BUCKET_NAME not set in environment")
+
+    filenames = await run_batch_and_write_files(instagram_urls, results_limit, timer=timer)
+    limit = asyncio.Semaphore(BATCH_PAGE_CONCURRENCY)
+
+    async def build_page(account: str, filename: str) -> dict:
+        json_file = os.path.join("static", filename)
+        cms_output = os.path.join("static", artifact_name("cms", ".html", account))
+        async with limit:
+            await generate_nightclub_page_async(json_file, cms_output, bucket_name, account=account)
+            cms_output, _ = await asyncio.to_thread(get_manifest().record, cms_output, "page", account)
+            download_link = await asyncio.to_thread(get_publisher().publish, cms_output)
+        await asyncio.to_thread(post_store.set_page, account, filename, cms_output)
+        return {
+            "download_link": download_link,
+            "total_items": os.path.getsize(json_file),
+        }
+
+    accounts = list(filenames)
+    with timer("build_pages"):
+        results = await asyncio.gather(
+            *(build_page(account, filenames[account]) for account in accounts), return_exceptions=True
+        )
+
+    pages, errors = {}, {}
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            errors[account] = str(result)
+        else:
+            pages[account] = result
+    for instagram_url in instagram_urls:
+        if account_key(instagram_url) not in filenames:
+            errors[account_key(instagram_url)] = "No posts returned"
+    return {"pages": pages, "errors": errors}
+
+# Actor run places reserved when a job was accepted (job id -> Reservation), used by its run.
+actor_reservations = {}
+# Scrapes with a queued or running job that holds a reservation (cache key -> job id).
+reserved_scrapes = {}
+
+def scrape_key(job: Job):
+    # The page_cache/dataset_cache key of a single-account job; batch jobs are never coalesced.
+    return None if job.kind == "batch" else (normalize_instagram_url(job.instagram_url), job.results_limit)
+
+def joins_scrape(key) -> bool:
+    # A job whose scrape is already queued, running or cached shares that actor run (see scrape_cache.py).
+    return key is not None and (key in reserved_scrapes or page_cache.active(key) or dataset_cache.active(key))
+
+def submit_scrape_job(job: Job, account: str) -> Job:
+    # Hold the job's place in the actor queue from now on, so a request accepted here is not
+    # turned away later for waiting too long behind the jobs that were accepted before it.
+    # Jobs that will join another scrape start no actor run and need no place.
+    key = scrape_key(job)
+    if not joins_scrape(key):
+        actor_reservations[job.id] = actor_admission.reserve(account)
+        if key is not None:
+            reserved_scrapes[key] = job.id
+    return job_queue.submit(job)
+
+# Background scrape pipeline: Apify run -> dataset -> JSON file -> image mirroring -> CMS page.
+async def run_scrape_job(job: Job) -> dict:
+    # Jobs resumed after a restart have no reservation and go through the admission check.
+    reservation = actor_reservations.pop(job.id, None)
+    key = scrape_key(job)
+    try:
+        with reservation.active() if reservation else nullcontext():
+            if job.kind == "batch":
+                return await build_batch_pages(job.instagram_urls, job.results_limit, timer=job.stage)
+            if reservation and (page_cache.active(key) or dataset_cache.active(key)):
+                # Another request got the scrape going first: give the place back right away.
+                reservation.release()
+            return await page_cache.get_or_run(
+                key, lambda: build_cms_page(job.instagram_url, job.results_limit, timer=job.stage)
+            )
+    finally:
+        if reserved_scrapes.get(key) == job.id:
+            del reserved_scrapes[key]
+
+job_queue = JobQueue(run_scrape_job)
+
+# Pre-warming: tracked accounts are refreshed in the background (see prewarm.py), so /scrape can
+# hand out their latest page right away.
+async def prewarm_account(instagram_url: str, results_limit: int = 12) -> dict:
+    # Incremental, so an account without new posts keeps its snapshot and page (no mirroring, no render).
+    account = account_key(instagram_url)
+    key = (normalize_instagram_url(instagram_url), results_limit)
+    previous = (await asyncio.to_thread(post_store.load, account)).get("page")
+    # Skip cached results, but join a scrape of the account that is already running.
+    dataset_cache.invalidate(key)
+    page_cache.invalidate(key)
+    result = await page_cache.get_or_run(
+        key, lambda: build_cms_page(instagram_url, results_limit, incremental=True)
+    )
+    page = (await asyncio.to_thread(post_store.load, account)).get("page")
+    return {**result, "page": page["path"], "changed": page != previous}
+
+prewarmer = Prewarmer(prewarm_account)
+
+def collect_queue_metrics() -> list:
+    # Admission and job queue gauges, read at scrape time.
+    controllers = {"actor_runs": actor_admission.stats(), "uploads": upload_admission.stats()}
+    return (
+        gauge_lines("admission_in_flight", "Operations holding an admission slot.",
+                    {name: stats["in_flight"] for name, stats in controllers.items()}, "controller")
+        + gauge_lines("admission_queue_depth", "Operations waiting for an admission slot.",
+                      {name: stats["queue_depth"] for name, stats in controllers.items()}, "controller")
+        + gauge_lines("job_queue_pending", "Scrape jobs submitted but not yet started.", {None: job_queue.pending()})
+    )
+
+register_collector(collect_queue_metrics)
+
+# METRICS_TIMING_HEADER=1 adds a Server-Timing header with the time spent in the app to every response.
+METRICS_TIMING_HEADER = os.environ.get("METRICS_TIMING_HEADER", "0") == "1"
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    # Labelled by route template (/jobs/{job_id}), not by raw path, to keep the series count bounded.
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=response.status_code)
+    if METRICS_TIMING_HEADER:
+        response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}"
+    return response
+
 @app.get("/health", response_class=PlainTextResponse)
 async def health(request: Request):
     return PlainTextResponse("OK")
@@ -83,42 +522,141 @@ async def home(request: Request):
 
 @app.post("/scrape", response_class=HTMLResponse)
 async def scrape(request: Request, instagram_url: str = Form(...)):
-    try:
-        filename = await run_apify_and_write_to_file(instagram_url, results_limit=12)
-    except Exception as e:
-        print("Error during scraping and file writing:", e)
-        raise HTTPException(status_code=500, detail=f"Scraping error: {e}")
-    
-    # Path to the JSON file in the nightclub folder.
-    json_file = os.path.join("static", filename)
-    # Generate a CMS HTML file also in the nightclub folder.
-    cms_output = os.path.join("static", f"cms_{datetime.now().strftime('%Y%m%d%H%M%S')}.html")
-    
     # Get the GCS bucket name from the environment.
-    bucket_name = os.environ.get("GCS_BUCKET_NAME")
-    if not bucket_name:
+    if not os.environ.get("GCS_BUCKET_NAME"):
         raise HTTPException(status_code=500, detail="GCS_BUCKET_NAME not set in environment")
-    
-    # Call the nightclub CMS generator.
-    await asyncio.to_thread(generate_nightclub_page, json_file, cms_output, bucket_name)
-    
-    file_size = os.path.getsize(json_file)
-    print(f"File {filename} size: {file_size} bytes")
-    
-    # Return a response with a link to the generated CMS page.
+
+    # Tracked accounts are answered with their latest pre-built page.
+    prewarmed = await asyncio.to_thread(prewarmer.fresh_page, account_key(instagram_url))
+    if prewarmed:
+        return templates.TemplateResponse("first_dashboard.html", {
+            "request": request,
+            "download_link": prewarmed["download_link"],
+            "total_items": prewarmed["total_items"],
+        })
+
+    # Queue the scrape and answer right away; the page polls /jobs/{id} for the result.
+    # A request whose actor run could not be admitted is turned away now (429/503).
+    job = submit_scrape_job(Job(instagram_url=instagram_url, results_limit=12), account_key(instagram_url))
     return templates.TemplateResponse("first_dashboard.html", {
         "request": request,
-        "download_link": f"/static/{os.path.basename(cms_output)}",
-        "total_items": file_size
+        "download_link": None,
+        "job_id": job.id
+    })
+
+@app.post("/scrape-batch", response_class=JSONResponse)
+async def scrape_batch(instagram_urls: str = Form(...)):
+    # One URL per line (commas work too); all of them go through a single actor run.
+    urls = [url.strip() for url in instagram_urls.replace(",", "\n").splitlines() if url.strip()]
+    if not urls:
+        raise HTTPException(status_code=400, detail="No Instagram URLs given")
+    if not os.environ.get("GCS_BUCKET_NAME"):
+        raise HTTPException(status_code=500, detail="GCS_BUCKET_NAME not set in environment")
+
+    job = submit_scrape_job(Job(kind="batch", instagram_urls=urls, results_limit=12), "batch")
+    return JSONResponse({"job_id": job.id, "status_url": f"/jobs/{job.id}"})
+
+@app.get("/jobs/{job_id}", response_class=JSONResponse)
+async def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job.to_dict())
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        {"detail": str(exc)}, status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.get("/admission/stats", response_class=JSONResponse)
+async def admission_stats():
+    # In-flight counts, queue depth and queue wait times of the admission controllers.
+    return JSONResponse({
+        "actor_runs": actor_admission.stats(),
+        "uploads": upload_admission.stats(),
+        "job_queue": {"queued": job_queue.pending()},
     })
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format: stage, transfer, render, file write and request histograms.
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/prewarm", response_class=JSONResponse)
+async def list_prewarmed():
+    # Tracked accounts with their next refresh and last outcome, plus scheduler counters.
+    accounts = await asyncio.to_thread(get_tracked_accounts().list)
+    return JSONResponse({"accounts": accounts, **prewarmer.stats()})
+
+@app.post("/prewarm", response_class=JSONResponse)
+async def track_account(instagram_url: str = Form(...), interval: float = Form(None), results_limit: int = Form(12)):
+    entry = await asyncio.to_thread(get_tracked_accounts().add, instagram_url, interval, results_limit)
+    return JSONResponse(entry)
+
+@app.delete("/prewarm/{account}", response_class=JSONResponse)
+async def untrack_account(account: str):
+    if not await asyncio.to_thread(get_tracked_accounts().remove, account.lower()):
+        raise HTTPException(status_code=404, detail="Account not tracked")
+    return JSONResponse({"removed": account.lower()})
+
+async def backfill_search_index():
+    search_index = get_search_index()
+    if search_index is None:
+        return
+    for directory in ("static", os.environ.get("RAW_ARCHIVE_DIR", "")):
+        if directory and os.path.isdir(directory):
+            written = await asyncio.to_thread(search_index.ingest_directory, directory)
+            logger.info("Indexed %d posts from %s for search", written, directory)
+
+@app.get("/search", response_class=JSONResponse)
+async def search_posts(q: str = None, hashtag: str = None, mention: str = None, tagged: str = None,
+                       location: str = None, account: str = None, since: str = None, until: str = None,
+                       limit: int = 20, cursor: str = None):
+    # Posts of every scraped snapshot, newest first; comma separated hashtags/mentions/tagged must all match.
+    search_index = get_search_index()
+    if search_index is None:
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    start = time.perf_counter()
+    try:
+        found = await asyncio.to_thread(
+            search_index.search, q, account, since, until, limit, cursor,
+            hashtag=hashtag, mention=mention, tagged=tagged, location=location,
+        )
+    except sqlite3.OperationalError as e:
+        # Malformed full-text query (e.g. unbalanced quotes).
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    found["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return JSONResponse(found)
+
+@app.get("/startup", response_class=JSONResponse)
+async def startup_report():
+    # Import/startup phases plus the first-use cost of lazily loaded modules and clients.
+    return JSONResponse(startup_timer.report())
+
+@app.get("/artifacts", response_class=JSONResponse)
+async def list_artifacts(account: str = None, kind: str = None, limit: int = 100):
+    # Served from the manifest; no directory scan.
+    entries = get_manifest().list(account, kind, limit)
+    for entry in entries:
+        entry["url"] = get_publisher().store.url(entry["name"])
+    return JSONResponse(entries)
+
+@app.get("/cache/stats", response_class=JSONResponse)
+async def cache_stats():
+    return JSONResponse({"datasets": dataset_cache.stats(), "pages": page_cache.stats()})
+
 @app.post("/scrape-text", response_class=PlainTextResponse)
 async def scrape_text(instagram_url: str = Form(...)):
     try:
-        filename = await run_apify_and_write_to_file(instagram_url, results_limit=12)
+        filename = await scrape_to_file(instagram_url, results_limit=12)
+    except AdmissionRejected:
+        raise  # answered with 429/503 and Retry-After by admission_rejected
     except Exception as e:
         return PlainTextResponse(f"Error: {e}", status_code=500)
-    return PlainTextResponse(f"File created: /static/{filename}")
+    return PlainTextResponse(f"File created: {get_publisher().store.url(filename)}")
+
+startup_timer.mark("create_app")
 
 if __name__ == "__main__":
     import uvicorn
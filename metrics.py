@@ -0,0 +1,112 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers everything from a template render to a full actor run.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []  # metrics in registration order
+_collectors = []  # callables returning extra exposition lines (gauges read at scrape time)
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+class Histogram:
+    """
+    Minimal thread-safe Prometheus histogram: observing a value is a bisect and three
+    additions under a lock, so it is cheap enough for per-image timings.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block took (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values[-1]}")
+        return lines
+
+def gauge_lines(name: str, documentation: str, values: dict, labelname: str = None) -> list:
+    """Exposition lines for a gauge; values maps a label value (or None) to the reading."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for label, value in values.items():
+        labels = {labelname: label} if labelname and label is not None else {}
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return lines
+
+def register_collector(collector):
+    """collector() is called on every /metrics scrape and returns exposition lines."""
+    _collectors.append(collector)
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+# Pipeline metrics shared across modules.
+STAGE_SECONDS = Histogram(
+    "scrape_stage_seconds", "Duration of each scrape pipeline stage (apify_run, dataset_fetch, render, ...).", ("stage",)
+)
+TRANSFER_SECONDS = Histogram(
+    "image_transfer_seconds", "Duration of each image/video download and GCS upload.", ("op",)
+)
+RENDER_SECONDS = Histogram(
+    "template_render_seconds", "Duration of rendering a template and streaming it to its file.", ("template",)
+)
+FILE_WRITE_SECONDS = Histogram(
+    "file_write_seconds", "Duration of writing snapshot pages and precompressed pages to disk.", ("kind",)
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Duration of HTTP requests by route.", ("method", "route", "status")
+)
+
+def stage_timer(name: str):
+    """Default pipeline stage timer: feeds scrape_stage_seconds{stage=name}."""
+    return STAGE_SECONDS.time(stage=name)
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+def source_hash(url: str) -> str:
+    """
+    Content key for a CDN file. Instagram names every file after the media it holds,
+    so the URL path stays the same across scrapes while the signed query string changes.
+    """
+    return hashlib.sha1(urlparse(url).path.encode("utf-8")).hexdigest()
+
+class MirrorIndex:
+    """
+    Persistent record of which post/child files have already been mirrored to GCS,
+    keyed by (bucket, post/child id, source hash). Stored in a local SQLite file.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("MIRROR_INDEX_PATH", "mirror_index.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS mirrors (
+                    bucket TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    source_hash TEXT NOT NULL,
+                    dest_blob TEXT NOT NULL,
+                    public_url TEXT NOT NULL,
+                    mirrored_at REAL NOT NULL,
+                    srcset TEXT,
+                    PRIMARY KEY (bucket, item_id, source_hash)
+                )
+                """
+            )
+            # Indexes created before responsive variants have no srcset column.
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(mirrors)")]
+            if "srcset" not in columns:
+                self._conn.execute("ALTER TABLE mirrors ADD COLUMN srcset TEXT")
+            # Responsive variants are shared by every post using the same image bytes.
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS variants (
+                    bucket TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    srcset TEXT NOT NULL,
+                    PRIMARY KEY (bucket, content_hash)
+                )
+                """
+            )
+
+    def lookup(self, bucket_name: str, item_id: str, source_url: str):
+        """Returns (public URL, srcset or None) of an earlier mirror of source_url, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT public_url, srcset FROM mirrors WHERE bucket = ? AND item_id = ? AND source_hash = ?",
+                (bucket_name, str(item_id), source_hash(source_url)),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def record(self, bucket_name: str, item_id: str, source_url: str, dest_blob: str, public_url: str,
+               srcset: str = None):
+        self._record(bucket_name, str(item_id), source_hash(source_url), dest_blob, public_url, srcset)
+
+    def _record(self, bucket_name: str, item_id: str, digest: str, dest_blob: str, public_url: str,
+                srcset: str = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO mirrors (bucket, item_id, source_hash, dest_blob, public_url, mirrored_at, srcset)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (bucket_name, item_id, digest, dest_blob, public_url, time.time(), srcset),
+            )
+
+    def lookup_variants(self, bucket_name: str, content_hash: str):
+        """Returns the srcset of variants already built from these image bytes, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT srcset FROM variants WHERE bucket = ? AND content_hash = ?", (bucket_name, content_hash)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_variants(self, bucket_name: str, content_hash: str, srcset: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO variants VALUES (?, ?, ?)", (bucket_name, content_hash, srcset))
+
+    def reconcile(self, bucket, prefixes=("images/", "videos/")) -> tuple:
+        """
+        Brings the index in line with the blobs that actually exist in the bucket:
+        drops entries whose blob is gone and adds blobs uploaded by other instances
+        (found through their "item-id"/"source-hash" metadata).
+        Returns (added, removed).
+        """
+        existing = {}
+        for prefix in prefixes:
+            for blob in bucket.list_blobs(prefix=prefix):
+                existing[blob.name] = blob.metadata or {}
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT dest_blob, item_id, source_hash FROM mirrors WHERE bucket = ?", (bucket.name,)
+            ).fetchall()
+        known = {(item_id, digest) for _, item_id, digest in rows}
+        stale = [(bucket.name, item_id, digest) for dest_blob, item_id, digest in rows if dest_blob not in existing]
+
+        added = 0
+        for name, metadata in existing.items():
+            item_id, digest = metadata.get("item-id"), metadata.get("source-hash")
+            if item_id and digest and (item_id, digest) not in known:
+                self._record(bucket.name, item_id, digest, name, f"https://storage.googleapis.com/{bucket.name}/{name}")
+                added += 1
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM mirrors WHERE bucket = ? AND item_id = ? AND source_hash = ?", stale
+            )
+        return added, len(stale)
+
+    def close(self):
+        self._conn.close()
+
+# Process-wide index, opened on first use. Set MIRROR_INDEX_PATH to "" to disable it.
+_index = None
+_index_lock = threading.Lock()
+
+def get_mirror_index():
+    global _index
+    if os.environ.get("MIRROR_INDEX_PATH") == "":
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = MirrorIndex()
+        return _index
+
+if __name__ == "__main__":
+    # Usage: python mirror_index.py <bucket-name>
+    from upload_utils import get_uploader
+    bucket_name = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("GCS_BUCKET_NAME")
+    added, removed = get_mirror_index().reconcile(get_uploader().bucket(bucket_name))
+    print(f"Mirror index reconciled: {added} added, {removed} removed")
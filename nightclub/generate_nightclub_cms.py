@@ -1,8 +1,16 @@
 import os
+import sys
 import json
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 import webbrowser
-from upload_utils import upload_image_to_gcs  # from your upload_utils.py
+
+# Both apps share the uploader in the repository root's upload_utils.py. The root is appended,
+# so this app's own modules (main.py) still take precedence.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(APP_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+from upload_utils import upload_image_to_gcs
 
 def generate_nightclub_page(json_file: str, output_html: str, bucket_name: str):
     # Load the scraped JSON data
@@ -59,7 +67,7 @@ def generate_nightclub_page(json_file: str, output_html: str, bucket_name: str):
 
     # Set up the Jinja2 environment using your "templates" folder.
     env = Environment(
-        loader=FileSystemLoader(searchpath="templates"),
+        loader=FileSystemLoader(searchpath=os.path.join(APP_DIR, "templates")),
         autoescape=select_autoescape(["html", "xml"])
     )
     template = env.get_template("nightclub_template.html")
@@ -1,6 +1,8 @@
 import os
+import sys
 import json
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI, Request, HTTPException, Form
 from fastapi.responses import HTMLResponse, PlainTextResponse
@@ -9,14 +11,31 @@ from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from apify_client import ApifyClient
 
+# The app is deployed from the repository root (see vercel.json), so its own files are found
+# relative to this directory rather than the working directory.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
 # Import the nightclub CMS generator function
 from generate_nightclub_cms import generate_nightclub_page
+# The shared uploader lives in the repository root (appended after this app's own directory).
+REPO_ROOT = os.path.dirname(APP_DIR)
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+from upload_utils import init_uploader, close_uploader
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the shared image uploader (pooled HTTP session + GCS client) once per process.
+    init_uploader()
+    yield
+    close_uploader()
 
 # Initialize FastAPI and templates.
 # (If you still want to serve static files from a folder named "nightclub", mount that folder.)
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app = FastAPI(lifespan=lifespan)
+templates = Jinja2Templates(directory=os.path.join(APP_DIR, "templates"))
+app.mount("/static", StaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
 load_dotenv()
 
 # Apify configuration: set your APIFY_TOKEN in the .env file.
@@ -59,7 +78,7 @@ async def run_apify_and_write_to_file(instagram_url: str, results_limit: int = 1
     
     # Save JSON output in the "nightclub" folder.
     filename = f"scraped_data_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-    output_dir = "nightclub"  # use this folder for output
+    output_dir = os.path.join(APP_DIR, "nightclub")  # use this folder for output
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     filepath = os.path.join(output_dir, filename)
@@ -87,9 +106,9 @@ async def scrape(request: Request, instagram_url: str = Form(...)):
         raise HTTPException(status_code=500, detail=f"Scraping error: {e}")
     
     # Path to the JSON file in the nightclub folder.
-    json_file = os.path.join("nightclub", filename)
+    json_file = os.path.join(APP_DIR, "nightclub", filename)
     # Generate a CMS HTML file also in the nightclub folder.
-    cms_output = os.path.join("nightclub", f"cms_{datetime.now().strftime('%Y%m%d%H%M%S')}.html")
+    cms_output = os.path.join(APP_DIR, "nightclub", f"cms_{datetime.now().strftime('%Y%m%d%H%M%S')}.html")
     
     # Get the GCS bucket name from the environment.
     bucket_name = os.environ.get("GCS_BUCKET_NAME")
@@ -0,0 +1,59 @@
+import os
+import logging
+import tempfile
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from metrics import RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Template engine settings (override them through environment variables).
+TEMPLATE_DIR = os.environ.get("TEMPLATE_DIR", "templates")
+# Compiled templates are cached here so a fresh process skips compilation. Set to "" to disable.
+# The default is under the temp dir, which stays writable when the app directory is read-only.
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "jinja_cache"))
+# Re-checks template files on every lookup; only worth it while editing templates.
+TEMPLATE_AUTO_RELOAD = os.environ.get("TEMPLATE_AUTO_RELOAD", "0") == "1"
+
+def make_template_env(directory: str = None, cache_dir: str = None, auto_reload: bool = None) -> Environment:
+    directory = directory or TEMPLATE_DIR
+    cache_dir = cache_dir if cache_dir is not None else TEMPLATE_CACHE_DIR
+    bytecode_cache = None
+    if cache_dir:
+        # The cache only saves compile time: without a usable directory, templates compile in memory.
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            if not os.access(cache_dir, os.W_OK):
+                raise PermissionError(f"{cache_dir} is not writable")
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError as e:
+            logger.warning("Template cache %s unavailable, compiling templates in memory: %s", cache_dir, e)
+    return Environment(
+        loader=FileSystemLoader(searchpath=directory),
+        autoescape=select_autoescape(["html", "xml"]),
+        bytecode_cache=bytecode_cache,
+        auto_reload=TEMPLATE_AUTO_RELOAD if auto_reload is None else auto_reload,
+    )
+
+# Process-wide environment, created on first use. Compiled templates stay in its in-memory cache.
+_env = None
+_env_lock = threading.Lock()
+
+def get_template_env() -> Environment:
+    global _env
+    with _env_lock:
+        if _env is None:
+            _env = make_template_env()
+        return _env
+
+def stream_template(name: str, **context):
+    """Yields the rendered template in chunks instead of building the page as one string."""
+    return get_template_env().get_template(name).generate(**context)
+
+def render_to_file(name: str, output_path: str, **context):
+    # Write to a temporary file first so readers never see a half-written page.
+    tmp_path = output_path + ".tmp"
+    with RENDER_SECONDS.time(template=name):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(stream_template(name, **context))
+        os.replace(tmp_path, output_path)
@@ -0,0 +1,86 @@
+import os
+import json
+import tempfile
+import threading
+from urllib.parse import urlparse
+from scrape_cache import normalize_instagram_url
+
+def account_key(instagram_url: str) -> str:
+    # "https://www.instagram.com/bijouboston/" -> "bijouboston"
+    path = urlparse(normalize_instagram_url(instagram_url)).path.strip("/")
+    return path.split("/")[0] if path else "unknown"
+
+class PostStore:
+    """
+    Per-account record of the posts we have already scraped, used for incremental scrapes.
+    Each account is one JSON file in POST_STORE_DIR holding the merged posts (projected, newest first),
+    the newest post timestamp and the last snapshot/page built from them.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.environ.get(
+            "POST_STORE_DIR", os.path.join(tempfile.gettempdir(), "post_store")
+        )
+        self._lock = threading.Lock()
+
+    def _path(self, account: str) -> str:
+        return os.path.join(self.directory, f"{account}.json")
+
+    def load(self, account: str) -> dict:
+        path = self._path(account)
+        if not os.path.exists(path):
+            return {"posts": [], "newest_timestamp": None, "snapshot": None, "page": None}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, account: str, state: dict):
+        # Created on first write, so importing the app touches no directory.
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(account) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(account))
+
+    def newest_timestamp(self, account: str):
+        """Newest post timestamp seen for account, in the "YYYY-MM-DDTHH:MM:SS" form the actor accepts."""
+        timestamp = self.load(account).get("newest_timestamp")
+        return timestamp[:19] if timestamp else None
+
+    def merge(self, account: str, new_posts: list, limit: int = 12) -> tuple:
+        """
+        Merges freshly scraped posts into the stored set (by post id, newest first,
+        capped at limit). Returns (posts, changed); changed is True when a post id was new.
+        Nothing is saved: the merged posts are stored by set_snapshot() once their snapshot is written.
+        """
+        state = self.load(account)
+        merged = {post.get("id"): post for post in state["posts"]}
+        changed = False
+        for post in new_posts:
+            if post.get("id") not in merged:
+                changed = True
+            merged[post.get("id")] = post
+        posts = sorted(merged.values(), key=lambda post: post.get("timestamp") or "", reverse=True)[:limit]
+        return posts, changed
+
+    def set_snapshot(self, account: str, snapshot: str, posts: list = None):
+        """Records the snapshot built for account, together with the merged posts it holds."""
+        with self._lock:
+            state = self.load(account)
+            if posts is not None:
+                state["posts"] = posts
+                state["newest_timestamp"] = posts[0].get("timestamp") if posts else None
+            state["snapshot"] = snapshot
+            self._save(account, state)
+
+    def set_page(self, account: str, snapshot: str, page: str):
+        with self._lock:
+            state = self.load(account)
+            state["page"] = {"snapshot": snapshot, "path": page}
+            self._save(account, state)
+
+    def page_for(self, account: str, snapshot: str):
+        """Returns the page already built from snapshot, if it is still on disk."""
+        page = self.load(account).get("page")
+        if page and page["snapshot"] == snapshot and os.path.exists(page["path"]):
+            return page["path"]
+        return None
@@ -0,0 +1,132 @@
+import os
+import gzip
+import json
+from dataclasses import dataclass, field, asdict
+
+# Compact post records: only the fields the pipeline and templates use. Raw Apify items
+# carry latestComments, owner profile data and long signed URLs we never read.
+
+# Set by image mirroring for rendering only, never stored on disk.
+MIRROR_FIELDS = ("proxy_image", "proxy_srcset", "proxy_video", "fallback_image")
+
+@dataclass(slots=True)
+class ChildPost:
+    id: str
+    type: str = None
+    caption: str = None
+    image_url: str = None
+    video_url: str = None
+    proxy_image: str = None
+    proxy_srcset: str = None
+    proxy_video: str = None
+    fallback_image: str = None
+
+@dataclass(slots=True)
+class Post:
+    id: str
+    type: str = None
+    caption: str = None
+    timestamp: str = None
+    owner_username: str = None
+    input_url: str = None
+    image_url: str = None
+    video_url: str = None
+    child_posts: list = field(default_factory=list)
+    proxy_image: str = None
+    proxy_srcset: str = None
+    proxy_video: str = None
+    fallback_image: str = None
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        for record in [data] + data["child_posts"]:
+            for key in MIRROR_FIELDS:
+                record.pop(key)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Post":
+        data = dict(data)
+        data["child_posts"] = [ChildPost(**child) for child in data.get("child_posts") or []]
+        return cls(**data)
+
+def _image_url(item: dict):
+    # Prefer the first entry of "images" and fall back to "displayUrl".
+    if item.get("images") and len(item["images"]) > 0:
+        return item["images"][0]
+    return item.get("displayUrl")
+
+def project_item(item: dict) -> Post:
+    """Projects one raw Apify dataset item down to a Post."""
+    children = item.get("childPosts") if isinstance(item.get("childPosts"), list) else []
+    return Post(
+        id=str(item.get("id", "unknown")),
+        type=item.get("type"),
+        caption=item.get("caption"),
+        timestamp=item.get("timestamp"),
+        owner_username=item.get("ownerUsername"),
+        input_url=item.get("inputUrl"),
+        image_url=_image_url(item),
+        video_url=item.get("videoUrl"),
+        child_posts=[
+            ChildPost(
+                id=str(child.get("id", "unknown")),
+                type=child.get("type"),
+                caption=child.get("caption"),
+                image_url=_image_url(child),
+                video_url=child.get("videoUrl"),
+            )
+            for child in children
+        ],
+    )
+
+def is_compact(path: str) -> bool:
+    return path.endswith(".jsonl.gz")
+
+def open_snapshot(path: str, mode: str = "rt"):
+    # Compact snapshots are gzip-compressed JSON Lines; everything else is plain text.
+    if is_compact(path):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode.replace("t", ""), encoding="utf-8")
+
+def write_posts(f, posts: list):
+    f.write("".join(json.dumps(post.to_dict(), separators=(",", ":")) + "\n" for post in posts))
+
+def read_posts(path: str, limit: int = None) -> list:
+    """
+    Reads posts from a snapshot: compact .jsonl.gz files hold projected posts,
+    older .jsonl/.json files hold raw Apify items and are projected on load.
+    """
+    posts = []
+    with open_snapshot(path) as f:
+        if path.endswith(".json"):
+            return [project_item(item) for item in json.load(f)[:limit]]
+        for line in f:
+            if limit is not None and len(posts) >= limit:
+                break
+            if line.strip():
+                data = json.loads(line)
+                posts.append(Post.from_dict(data) if is_compact(path) else project_item(data))
+    return posts
+
+class RawArchive:
+    """
+    Optional gzip JSON Lines copy of the untouched Apify items (RAW_ARCHIVE_DIR, off when unset),
+    for when a field we dropped is needed later.
+    """
+
+    def __init__(self, snapshot_name: str, directory: str = None):
+        directory = directory if directory is not None else os.environ.get("RAW_ARCHIVE_DIR", "")
+        self._file = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            name = snapshot_name.split(".")[0] + ".raw.jsonl.gz"
+            self._file = gzip.open(os.path.join(directory, name), "wt", encoding="utf-8")
+
+    def write(self, items: list):
+        if self._file is not None:
+            self._file.write("".join(json.dumps(item) + "\n" for item in items))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,240 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from post_store import account_key
+from scrape_cache import normalize_instagram_url
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# Pre-warming settings (override them through environment variables).
+# Default seconds between two refreshes of a tracked account; 0 disables the scheduler.
+PREWARM_INTERVAL = float(os.environ.get("PREWARM_INTERVAL", "3600"))
+# Each next refresh is moved by up to this fraction of the interval, so accounts drift apart.
+PREWARM_JITTER = float(os.environ.get("PREWARM_JITTER", "0.1"))
+# Refreshes running at once (each is an actor run plus image mirroring).
+PREWARM_CONCURRENCY = int(os.environ.get("PREWARM_CONCURRENCY", "2"))
+# Failed refreshes are retried after this many seconds (or the interval, if shorter).
+PREWARM_RETRY = float(os.environ.get("PREWARM_RETRY", "300"))
+# Accounts tracked from startup, comma separated (more can be added through POST /prewarm).
+PREWARM_ACCOUNTS = [url.strip() for url in os.environ.get("PREWARM_ACCOUNTS", "").split(",") if url.strip()]
+
+class TrackedAccounts:
+    """
+    Registry of the Instagram accounts kept warm: refresh interval, when the next refresh is due
+    and the outcome of the last one (the page it left, as handed out by /scrape), stored in a
+    local SQLite file.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("PREWARM_REGISTRY_PATH", "prewarm.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tracked_accounts (
+                    account TEXT PRIMARY KEY,
+                    instagram_url TEXT NOT NULL,
+                    results_limit INTEGER NOT NULL,
+                    interval REAL NOT NULL,
+                    next_run REAL NOT NULL,
+                    last_run REAL,
+                    last_status TEXT,
+                    last_error TEXT,
+                    refreshed_at REAL,
+                    page TEXT,
+                    download_link TEXT,
+                    total_items INTEGER
+                )
+                """
+            )
+
+    def add(self, instagram_url: str, interval: float = None, results_limit: int = 12) -> dict:
+        """
+        Tracks an account (or updates its settings). A new account's first refresh is spread over
+        the first jitter share of its interval, so a batch of additions does not fire at once.
+        """
+        instagram_url = normalize_instagram_url(instagram_url)
+        account = account_key(instagram_url)
+        interval = interval or PREWARM_INTERVAL
+        first_run = time.time() + random.uniform(0, PREWARM_JITTER * interval)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO tracked_accounts (account, instagram_url, results_limit, interval, next_run)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (account) DO UPDATE SET
+                    instagram_url = excluded.instagram_url,
+                    results_limit = excluded.results_limit,
+                    interval = excluded.interval
+                """,
+                (account, instagram_url, results_limit, interval, first_run),
+            )
+        return self.get(account)
+
+    def remove(self, account: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM tracked_accounts WHERE account = ?", (account,)).rowcount > 0
+
+    def get(self, account: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tracked_accounts WHERE account = ?", (account,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self) -> list:
+        """Soonest due first."""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM tracked_accounts ORDER BY next_run")]
+
+    def due(self, now: float = None) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM tracked_accounts WHERE next_run <= ? ORDER BY next_run", (now or time.time(),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def next_due(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_run) FROM tracked_accounts").fetchone()
+        return row[0]
+
+    def record(self, account: str, status: str, next_run: float, error: str = None, result: dict = None):
+        """Stores the outcome of a refresh; result (page, download_link, total_items) only when it succeeded."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE tracked_accounts SET last_run = ?, last_status = ?, last_error = ?, next_run = ? WHERE account = ?",
+                (now, status, error, next_run, account),
+            )
+            if result is not None:
+                self._conn.execute(
+                    "UPDATE tracked_accounts SET refreshed_at = ?, page = ?, download_link = ?, total_items = ?"
+                    " WHERE account = ?",
+                    (now, result["page"], result["download_link"], result["total_items"], account),
+                )
+
+    def close(self):
+        self._conn.close()
+
+# Process-wide registry, opened on first use.
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_tracked_accounts() -> TrackedAccounts:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TrackedAccounts()
+        return _registry
+
+class Prewarmer:
+    """
+    In-process scheduler that refreshes every tracked account once per interval (with jitter),
+    at most concurrency at a time. refresh is an async function taking (instagram_url, results_limit)
+    and returning {"page", "download_link", "total_items", "changed"}; an unchanged account keeps
+    its page and only costs the (incremental) actor run.
+    """
+
+    def __init__(self, refresh, registry: TrackedAccounts = None, concurrency: int = PREWARM_CONCURRENCY,
+                 jitter: float = PREWARM_JITTER, tick: float = 60):
+        self.refresh = refresh
+        self._registry = registry
+        self.concurrency = max(1, concurrency)
+        self.jitter = jitter
+        self.tick = tick
+        self._limit = None
+        self._running = {}  # account -> asyncio.Task
+        self.refreshed = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    @property
+    def registry(self) -> TrackedAccounts:
+        return self._registry if self._registry is not None else get_tracked_accounts()
+
+    def _next_run(self, interval: float) -> float:
+        return time.time() + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def run(self, interval: float = PREWARM_INTERVAL):
+        """Background task: starts due refreshes until cancelled (interval 0 disables it)."""
+        if interval <= 0:
+            return
+        self._limit = asyncio.Semaphore(self.concurrency)
+        for instagram_url in PREWARM_ACCOUNTS:
+            if not await asyncio.to_thread(self.registry.get, account_key(instagram_url)):
+                await asyncio.to_thread(self.registry.add, instagram_url)
+        try:
+            while True:
+                try:
+                    for entry in await asyncio.to_thread(self.registry.due):
+                        if entry["account"] not in self._running:
+                            self._running[entry["account"]] = asyncio.create_task(self._refresh(entry))
+                    next_due = await asyncio.to_thread(self.registry.next_due)
+                except Exception as e:
+                    logger.error("Pre-warming scheduler failed: %s", e)
+                    next_due = None
+                # Wake up for the next due account, but at least every tick to pick up new ones.
+                delay = self.tick if next_due is None else min(self.tick, max(1.0, next_due - time.time()))
+                await asyncio.sleep(delay)
+        finally:
+            for task in self._running.values():
+                task.cancel()
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def _refresh(self, entry: dict):
+        account = entry["account"]
+        try:
+            async with self._limit:
+                try:
+                    result = await self.refresh(entry["instagram_url"], entry["results_limit"])
+                except AdmissionRejected as e:
+                    # User scrapes hold the actor slots: try again once one is likely free.
+                    await asyncio.to_thread(
+                        self.registry.record, account, "deferred", time.time() + e.retry_after, str(e)
+                    )
+                    return
+                except Exception as e:
+                    self.failed += 1
+                    logger.error("Pre-warming %s failed: %s", account, e)
+                    retry = min(PREWARM_RETRY, entry["interval"])
+                    await asyncio.to_thread(self.registry.record, account, "failed", self._next_run(retry), str(e))
+                    return
+            if result["changed"]:
+                self.refreshed += 1
+            else:
+                self.unchanged += 1
+            status = "refreshed" if result["changed"] else "unchanged"
+            logger.info("Pre-warmed %s: %s", account, status)
+            await asyncio.to_thread(
+                self.registry.record, account, status, self._next_run(entry["interval"]), None, result
+            )
+        finally:
+            self._running.pop(account, None)
+
+    def fresh_page(self, account: str):
+        """
+        The tracked account's latest pre-built page, if it was refreshed within its interval
+        (plus jitter) and is still on disk; None otherwise.
+        """
+        entry = self.registry.get(account)
+        if not entry or not entry["refreshed_at"] or not entry["page"]:
+            return None
+        max_age = entry["interval"] * (1 + self.jitter) + PREWARM_RETRY
+        if time.time() - entry["refreshed_at"] > max_age or not os.path.exists(entry["page"]):
+            return None
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.registry.list()),
+            "running": sorted(self._running),
+            "refreshed": self.refreshed,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+        }
@@ -1,43 +1,97 @@
 import time
 import os
-import boto3
-from botocore.exceptions import ClientError
+import json
+import logging
+import threading
+from startup_timing import lazy_import, startup_timer
+
+logger = logging.getLogger(__name__)
+
+# Secrets Manager settings (override them through environment variables).
+GCP_CREDS_SECRET_NAME = os.environ.get("GCP_CREDS_SECRET_NAME", "gcs/secrets/lucano")  # Your secret name in AWS Secrets Manager
+GCP_CREDS_REGION = os.environ.get("GCP_CREDS_REGION", "us-east-2")                      # Your region
+# Fetched credentials are kept in memory and fetched again after this many seconds.
+GCP_CREDS_TTL = float(os.environ.get("GCP_CREDS_TTL", "3600"))
 
 def get_secret():
-    secret_name = "gcs/secrets/lucano"  # Your secret name in AWS Secrets Manager
-    region_name = "us-east-2"            # Your region
+    # boto3 takes a while to import, so it is only loaded when a secret is actually needed.
+    boto3 = lazy_import("boto3")
+    ClientError = lazy_import("botocore.exceptions").ClientError
 
-    print("→ Starting secret retrieval from AWS Secrets Manager...")
+    logger.debug("Starting secret retrieval from AWS Secrets Manager...")
     session = boto3.session.Session()
-    client = session.client(service_name='secretsmanager', region_name=region_name)
+    client = session.client(service_name='secretsmanager', region_name=GCP_CREDS_REGION)
 
     try:
         start_time = time.time()
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+        get_secret_value_response = client.get_secret_value(SecretId=GCP_CREDS_SECRET_NAME)
         elapsed = time.time() - start_time
-        print(f"→ Secret successfully retrieved in {elapsed:.2f} seconds.")
+        logger.debug("Secret successfully retrieved in %.2f seconds.", elapsed)
+        startup_timer.record_lazy("gcp_credentials_fetch", elapsed)
         return get_secret_value_response['SecretString']
     except ClientError as e:
-        print(f"‼️ Error retrieving secret: {e}")
+        logger.error("Error retrieving secret: %s", e)
         raise e
 
+# In-memory credentials: (credentials, project id, fetched at, secret string).
+_credentials = None
+_credentials_lock = threading.Lock()
+_refreshing = False
+
+def get_google_credentials(ttl: float = None) -> tuple:
+    """
+    Returns (credentials, project id) built from the service account secret, without touching
+    /tmp. The secret is fetched on first use and again once it is older than ttl seconds. A
+    refresh that returns the same secret keeps the same credentials object, so callers can tell
+    a rotated key from a routine refresh. While one thread refreshes, the others keep using the
+    cached credentials; if a refresh fails, the credentials we already have are kept.
+    """
+    global _credentials, _refreshing
+    ttl = GCP_CREDS_TTL if ttl is None else ttl
+    with _credentials_lock:
+        cached = _credentials
+        if cached is not None and (time.monotonic() - cached[2] < ttl or _refreshing):
+            return cached[0], cached[1]
+        _refreshing = True
+    # The Secrets Manager round trip runs outside the lock.
+    try:
+        secret = get_secret()
+        info = json.loads(secret)
+        if cached is not None and cached[3] == secret:
+            credentials = cached[0]
+        else:
+            credentials = lazy_import("google.oauth2.service_account").Credentials.from_service_account_info(info)
+    except Exception as e:
+        with _credentials_lock:
+            _refreshing = False
+            if _credentials is None:
+                raise
+            logger.warning("Keeping cached Google credentials, refresh failed: %s", e)
+            _credentials = _credentials[:2] + (time.monotonic(),) + _credentials[3:]
+            return _credentials[0], _credentials[1]
+    with _credentials_lock:
+        _refreshing = False
+        _credentials = (credentials, info.get("project_id"), time.monotonic(), secret)
+        return _credentials[0], _credentials[1]
+
 def setup_google_credentials():
-    print("→ Setting up Google credentials...")
+    logger.info("Setting up Google credentials...")
     # Retrieve the secret (JSON string)
     gcp_creds_json = get_secret()
     
     # Write the secret to a temporary file (AWS environments allow /tmp)
     temp_path = "/tmp/google_creds.json"
-    print(f"→ Writing credentials to temporary file at {temp_path}...")
+    logger.info("Writing credentials to temporary file at %s...", temp_path)
     with open(temp_path, "w", encoding="utf-8") as f:
         f.write(gcp_creds_json)
-    print("→ Credentials written to temporary file.")
+    logger.info("Credentials written to temporary file.")
 
     # Set the environment variable so that other processes can pick it up.
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_path
-    print(f"→ Environment variable GOOGLE_APPLICATION_CREDENTIALS set to {temp_path}")
+    logger.info("Environment variable GOOGLE_APPLICATION_CREDENTIALS set to %s", temp_path)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     print("=== Starting Google credentials setup ===")
     setup_google_credentials()
     print("=== Google credentials setup completed ===")
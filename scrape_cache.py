@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+def normalize_instagram_url(instagram_url: str) -> str:
+    """
+    Canonical form of a profile URL so that "instagram.com/club", "https://www.instagram.com/Club/?hl=en"
+    and friends share one cache entry.
+    """
+    url = instagram_url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host == "instagram.com":
+        host = "www.instagram.com"
+    path = parsed.path.rstrip("/").lower() + "/"
+    return f"https://{host}{path}"
+
+class SingleFlightCache:
+    """
+    Async TTL cache with LRU eviction and single-flight loading: concurrent callers
+    for the same key share one in-flight call, and finished values are reused
+    until they expire. Failures are never cached.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("SCRAPE_CACHE_TTL", "300"))
+        self.max_entries = max_entries or int(os.environ.get("SCRAPE_CACHE_SIZE", "128"))
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Future
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_run(self, key, func):
+        """Returns the cached value for key, or awaits func() (at most once per key at a time)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        if key in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+        self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def _store(self, key, value):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def active(self, key) -> bool:
+        """True when get_or_run(key) would not call func: a fresh value or a call in flight."""
+        entry = self._entries.get(key)
+        return key in self._inflight or (entry is not None and entry[0] > time.monotonic())
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
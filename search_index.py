@@ -0,0 +1,288 @@
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import logging
+from posts import open_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Term kinds of the inverted index, as accepted by SearchIndex.search.
+TERM_KINDS = ("hashtag", "mention", "tagged", "location")
+HASHTAG = re.compile(r"#(\w+)")
+MENTION = re.compile(r"@([\w.]+\w)")
+SEARCH_MAX_LIMIT = 100
+
+def _terms(values) -> set:
+    return {str(value).strip().lstrip("#@").lower() for value in values or () if str(value).strip()}
+
+def extract_post(item: dict) -> dict:
+    """
+    Search record of a raw Apify item or a compact Post dict. Compact posts carry no hashtag,
+    mention, tag or location lists, so hashtags and mentions are taken from the caption.
+    """
+    caption = item.get("caption") or ""
+    owner = (item.get("ownerUsername") or item.get("owner_username") or "unknown").lower()
+    tagged = [user.get("username") if isinstance(user, dict) else user for user in item.get("taggedUsers") or ()]
+    return {
+        "id": str(item.get("id")),
+        "account": owner,
+        "timestamp": item.get("timestamp") or "",
+        "caption": caption,
+        "location_name": item.get("locationName"),
+        "url": item.get("url") or (f"https://www.instagram.com/p/{item['shortCode']}/" if item.get("shortCode") else None),
+        "image_url": item.get("displayUrl") or item.get("image_url"),
+        "hashtags": sorted(_terms(item.get("hashtags")) | _terms(HASHTAG.findall(caption))),
+        "mentions": sorted(_terms(item.get("mentions")) | _terms(MENTION.findall(caption))),
+        "tagged": sorted(_terms(tagged)),
+    }
+
+class SearchIndex:
+    """
+    Search over every post we scraped, deduplicated by post id, in a local SQLite file:
+    - posts, with indexes by time and by (account, time);
+    - post_terms, an inverted index (kind, term, timestamp, post id) over hashtags, mentions,
+      tagged users and locations, clustered so a term lookup reads its posts newest first;
+    - posts_fts, a full-text index (FTS5) over captions and location names.
+    Queries read only the matching rows, so their cost does not grow with the number of snapshots.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.environ.get("SEARCH_INDEX_PATH", "search_index.sqlite3")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS posts (
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    account TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    caption TEXT,
+                    location_name TEXT,
+                    url TEXT,
+                    image_url TEXT,
+                    hashtags TEXT NOT NULL,
+                    mentions TEXT NOT NULL,
+                    tagged TEXT NOT NULL,
+                    snapshot TEXT
+                );
+                CREATE INDEX IF NOT EXISTS posts_by_time ON posts (timestamp, id);
+                CREATE INDEX IF NOT EXISTS posts_by_account ON posts (account, timestamp, id);
+                CREATE TABLE IF NOT EXISTS post_terms (
+                    kind TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    post_id TEXT NOT NULL,
+                    PRIMARY KEY (kind, term, timestamp, post_id)
+                ) WITHOUT ROWID;
+                CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+                    caption, location_name, content='posts', content_rowid='rowid'
+                );
+                CREATE TABLE IF NOT EXISTS ingested_files (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                """
+            )
+
+    def _delete(self, row):
+        self._conn.execute("DELETE FROM post_terms WHERE post_id = ?", (row["id"],))
+        self._conn.execute(
+            "INSERT INTO posts_fts (posts_fts, rowid, caption, location_name) VALUES ('delete', ?, ?, ?)",
+            (row["rowid"], row["caption"], row["location_name"]),
+        )
+        self._conn.execute("DELETE FROM posts WHERE rowid = ?", (row["rowid"],))
+
+    def ingest_items(self, items: list, snapshot: str = None) -> int:
+        """
+        Adds raw Apify items or compact Post dicts. A post id we already have is only re-indexed
+        when the new copy differs (e.g. an edited caption). Returns the number of posts written.
+        """
+        written = 0
+        with self._lock, self._conn:
+            for item in items:
+                if not isinstance(item, dict) or item.get("id") is None:
+                    continue
+                post = extract_post(item)
+                row = self._conn.execute(
+                    "SELECT rowid, id, caption, location_name, hashtags, mentions, tagged FROM posts WHERE id = ?",
+                    (post["id"],),
+                ).fetchone()
+                if row is not None:
+                    # A compact copy has less to say than the raw one we may already have indexed.
+                    unchanged = (row["caption"] or "") == post["caption"] and (
+                        not post["location_name"] or row["location_name"] == post["location_name"]
+                    ) and set(post["tagged"]) <= set(json.loads(row["tagged"]))
+                    if unchanged:
+                        continue
+                    self._delete(row)
+                cursor = self._conn.execute(
+                    "INSERT INTO posts (id, account, timestamp, caption, location_name, url, image_url, hashtags,"
+                    " mentions, tagged, snapshot) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (post["id"], post["account"], post["timestamp"], post["caption"], post["location_name"],
+                     post["url"], post["image_url"], json.dumps(post["hashtags"]), json.dumps(post["mentions"]),
+                     json.dumps(post["tagged"]), snapshot),
+                )
+                self._conn.execute(
+                    "INSERT INTO posts_fts (rowid, caption, location_name) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, post["caption"], post["location_name"]),
+                )
+                terms = [("hashtag", term) for term in post["hashtags"]] + [
+                    ("mention", term) for term in post["mentions"]] + [("tagged", term) for term in post["tagged"]]
+                if post["location_name"]:
+                    terms.append(("location", post["location_name"].lower()))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO post_terms VALUES (?, ?, ?, ?)",
+                    [(kind, term, post["timestamp"], post["id"]) for kind, term in terms],
+                )
+                written += 1
+        return written
+
+    def ingest_file(self, path: str) -> int:
+        """Ingests a snapshot or raw archive file, unless it is unchanged since it was last ingested."""
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns, size FROM ingested_files WHERE path = ?", (path,)).fetchone()
+        if row and (row["mtime_ns"], row["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return 0
+        with open_snapshot(path) as f:
+            if path.endswith(".json"):
+                items = json.load(f)
+            else:
+                items = [json.loads(line) for line in f if line.strip()]
+        written = self.ingest_items(items if isinstance(items, list) else [], os.path.basename(path))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?)", (path, stat.st_mtime_ns, stat.st_size)
+            )
+        return written
+
+    def ingest_directory(self, directory: str) -> int:
+        """Backfill from snapshots (raw .json/.jsonl and compact .jsonl.gz) and raw archives in directory."""
+        written = 0
+        for path in sorted(glob.glob(os.path.join(directory, "scraped_data_*.json*")) +
+                           glob.glob(os.path.join(directory, "*.raw.jsonl.gz"))):
+            try:
+                written += self.ingest_file(path)
+            except (OSError, EOFError, ValueError) as e:
+                # Unreadable or still being written: picked up again once it changes.
+                logger.warning("Skipping %s: %s", path, e)
+        return written
+
+    def search(self, q: str = None, account: str = None, since: str = None, until: str = None,
+               limit: int = 20, cursor: str = None, **terms) -> dict:
+        """
+        Posts matching every given filter, newest first:
+        - q: full-text query over captions and location names (FTS5 syntax, e.g. "rooftop OR terrace");
+        - hashtag, mention, tagged, location: exact terms (a list, or comma separated, means all of them);
+        - account: the posting account; since/until: ISO timestamps or dates (until is exclusive).
+        Returns {"results", "next_cursor"}; pass next_cursor back to get the following page.
+        """
+        limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+        filters = []
+        for kind in TERM_KINDS:
+            values = terms.get(kind)
+            if isinstance(values, str):
+                values = values.split(",") if kind != "location" else [values]
+            filters += [(kind, term) for term in sorted(_terms(values))]
+
+        # Drive the query from the first term's index range (already in time order) when there is one.
+        if filters:
+            query = ("SELECT p.* FROM post_terms t JOIN posts p ON p.id = t.post_id"
+                     " WHERE t.kind = ? AND t.term = ?")
+            params = list(filters[0])
+            time_column = "t.timestamp"
+            id_column = "t.post_id"
+        else:
+            query, params, time_column, id_column = "SELECT p.* FROM posts p WHERE 1 = 1", [], "p.timestamp", "p.id"
+        for kind, term in filters[1:]:
+            query += " AND EXISTS (SELECT 1 FROM post_terms WHERE kind = ? AND term = ? AND post_id = p.id)"
+            params += [kind, term]
+        if q:
+            query += " AND p.rowid IN (SELECT rowid FROM posts_fts WHERE posts_fts MATCH ?)"
+            params.append(q)
+        if account:
+            query += " AND p.account = ?"
+            params.append(account.lstrip("@").lower())
+        if since:
+            query += f" AND {time_column} >= ?"
+            params.append(since)
+        if until:
+            query += f" AND {time_column} < ?"
+            params.append(until)
+        if cursor:
+            # Keyset pagination: constant cost however deep the page.
+            timestamp, _, post_id = cursor.partition("|")
+            query += f" AND ({time_column} < ? OR ({time_column} = ? AND {id_column} < ?))"
+            params += [timestamp, timestamp, post_id]
+        query += f" ORDER BY {time_column} DESC, {id_column} DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        results = []
+        for row in rows[:limit]:
+            result = dict(row)
+            del result["rowid"]
+            for key in ("hashtags", "mentions", "tagged"):
+                result[key] = json.loads(result[key])
+            results.append(result)
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = f"{results[-1]['timestamp']}|{results[-1]['id']}"
+        return {"results": results, "next_cursor": next_cursor}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "posts": self._conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0],
+                "terms": self._conn.execute("SELECT COUNT(*) FROM post_terms").fetchone()[0],
+                "files": self._conn.execute("SELECT COUNT(*) FROM ingested_files").fetchone()[0],
+            }
+
+    def close(self):
+        self._conn.close()
+
+# Process-wide index, opened on first use. SEARCH_INDEX_PATH="" disables it.
+_index = None
+_index_lock = threading.Lock()
+
+def get_search_index():
+    global _index
+    if os.environ.get("SEARCH_INDEX_PATH") == "":
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+if __name__ == "__main__":
+    # Usage: python search_index.py [--ingest static nightclub nightclub/nightclub] [--mention yungtut_] [--q ...]
+    parser = argparse.ArgumentParser(description="Index scraped posts and search them.")
+    parser.add_argument("--ingest", nargs="*", default=[], help="Directories to backfill")
+    parser.add_argument("--q", help="Full-text query over captions and locations")
+    for kind in TERM_KINDS + ("account", "since", "until"):
+        parser.add_argument(f"--{kind}")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    index = get_search_index()
+    for directory in args.ingest:
+        start = time.perf_counter()
+        print(f"Indexed {index.ingest_directory(directory)} posts from {directory} in {time.perf_counter() - start:.2f}s")
+    filters = {key: value for key, value in vars(args).items() if key not in ("ingest", "limit") and value}
+    if filters:
+        start = time.perf_counter()
+        found = index.search(limit=args.limit, **filters)
+        took = (time.perf_counter() - start) * 1000
+        for post in found["results"]:
+            print(post["timestamp"][:16], post["account"], post["location_name"] or "", post["url"] or post["id"])
+        print(f"{len(found['results'])} results in {took:.1f}ms, next cursor: {found['next_cursor']}")
+    print("Index:", index.stats())
@@ -0,0 +1,55 @@
+import sys
+import time
+import importlib
+import threading
+
+class StartupTimer:
+    """
+    Records how long each startup phase took (seconds, in order) plus the first-use cost of
+    the modules and clients that are only loaded on demand, so cold-start regressions show up
+    in the /startup report. For a per-module import breakdown run: python -X importtime -c "import main"
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._last = self.started_at
+        self.phases = {}  # phase name -> seconds
+        self.lazy = {}  # module/client name -> seconds spent on first use
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str):
+        """Ends phase: records the time since the previous mark."""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases[phase] = round(now - self._last, 4)
+            self._last = now
+
+    def record_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = round(seconds, 4)
+
+    def record_lazy(self, name: str, seconds: float):
+        with self._lock:
+            self.lazy.setdefault(name, round(seconds, 4))
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "phases": dict(self.phases),
+                "total": round(sum(self.phases.values()), 4),
+                "lazy": dict(self.lazy),
+            }
+
+# Process-wide timer; importing this module first starts the clock.
+startup_timer = StartupTimer()
+
+def lazy_import(module_name: str):
+    """Imports module_name on first use, recording how long the import took."""
+    # Always go through importlib: a module another thread is still importing is already in
+    # sys.modules, but only import_module waits for it to finish initializing.
+    loaded = module_name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not loaded:
+        startup_timer.record_lazy(f"import {module_name}", time.perf_counter() - start)
+    return module
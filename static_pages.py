@@ -0,0 +1,114 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from functools import lru_cache
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from metrics import FILE_WRITE_SECONDS
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: without it pages only get a gzip sibling.
+    brotli = None
+
+# Generated pages and snapshots carry a timestamp in their name and are never rewritten.
+IMMUTABLE_FILES = re.compile(r"^(cms|scraped_data)_\d{14}")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Anything else under /static (hand-placed files) is revalidated on every use.
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+# Precompressed siblings, in order of preference: (file suffix, Content-Encoding).
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = (".html", ".json", ".jsonl", ".css", ".js", ".svg", ".txt")
+
+def publish_page(path: str) -> list:
+    """
+    Writes gzip and brotli siblings (path.gz, path.br) next to a generated file so the static
+    handler can serve them without compressing on every request. Returns the files written.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    siblings = [("gzip", path + ".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        siblings.append(("br", path + ".br", lambda: brotli.compress(data, quality=11)))
+    for encoding, sibling, compress in siblings:
+        # Write to a temporary file first so a request never picks up a half-written sibling.
+        tmp_path = sibling + ".tmp"
+        with FILE_WRITE_SECONDS.time(kind=encoding):
+            with open(tmp_path, "wb") as f:
+                f.write(compress())
+            os.replace(tmp_path, sibling)
+        written.append(sibling)
+    return written
+
+@lru_cache(maxsize=1024)
+def _content_hash(path: str, mtime_ns: int, size: int) -> str:
+    # Keyed by mtime/size as well, so a rewritten file is hashed again.
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+def accepted_encodings(request_headers: Headers) -> dict:
+    # "br;q=1.0, gzip;q=0.8, *;q=0.1" -> {"br": 1.0, "gzip": 0.8, "*": 0.1}
+    accepted = {}
+    for part in request_headers.get("accept-encoding", "").split(","):
+        coding, *params = [token.strip() for token in part.split(";")]
+        try:
+            quality = next((float(p[2:]) for p in params if p.startswith("q=")), 1.0)
+        except ValueError:
+            quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    return accepted
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the .br/.gz sibling of a file when the client accepts it, with
+    strong ETags (content hash, one per encoding) and long-lived caching for the timestamped
+    pages and snapshots we generate. Conditional requests get 304 Not Modified.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        name = os.path.basename(full_path)
+
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL if IMMUTABLE_FILES.match(name) else DEFAULT_CACHE_CONTROL,
+        }
+        media_type = None
+        serve_path, serve_stat, encoding = full_path, stat_result, None
+        if full_path.endswith(COMPRESSIBLE_TYPES):
+            headers["vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers)
+            for coding, suffix in ENCODINGS:
+                # q=0 refuses a coding; "*" covers codings that are not listed.
+                if accepted.get(coding, accepted.get("*", 0)) <= 0:
+                    continue
+                try:
+                    sibling_stat = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                # A sibling older than its file is stale; serve the file itself instead.
+                if sibling_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                    serve_path, serve_stat, encoding = full_path + suffix, sibling_stat, coding
+                    break
+            if encoding is not None:
+                headers["content-encoding"] = encoding
+                media_type = mimetypes.guess_type(full_path)[0]
+
+        etag = _content_hash(full_path, stat_result.st_mtime_ns, stat_result.st_size)
+        headers["etag"] = f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+
+        response = FileResponse(
+            serve_path, status_code=status_code, headers=headers, media_type=media_type, stat_result=serve_stat
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from admission import AdmissionController, AdmissionRejected
+
+def batch_controller(max_wait: float = 0.05) -> AdmissionController:
+    # Like actor_admission for batch runs: one at a time per key, short deadline for waiters.
+    return AdmissionController("actor_runs", limit=8, per_key_limit=1, max_queue=32, max_wait=max_wait)
+
+async def run_job(controller, reservation, key, hold: float):
+    with reservation.active():
+        async with controller.admit(key):
+            await asyncio.sleep(hold)
+
+def test_accepted_job_waits_past_max_wait_instead_of_failing():
+    async def scenario():
+        controller = batch_controller()
+        first = asyncio.create_task(run_job(controller, controller.reserve("batch"), "batch", 0.2))
+        await asyncio.sleep(0)
+        # Accepted while the first batch runs: it waits its turn for longer than max_wait.
+        second = asyncio.create_task(run_job(controller, controller.reserve("batch"), "batch", 0))
+        await asyncio.gather(first, second)
+        assert controller.stats()["timed_out"] == 0
+        assert controller.stats()["admitted"] == 2
+
+    asyncio.run(scenario())
+
+def test_reservations_count_against_the_per_key_queue():
+    async def scenario():
+        controller = batch_controller()
+        first = asyncio.create_task(run_job(controller, controller.reserve("batch"), "batch", 0.1))
+        await asyncio.sleep(0)
+        second = controller.reserve("batch")
+        # The second job has not reached acquire() yet, but its place is taken: a third is turned away now.
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.reserve("batch")
+        assert rejected.value.status_code == 429
+        await asyncio.gather(first, run_job(controller, second, "batch", 0))
+
+    asyncio.run(scenario())
+
+def test_unused_reservation_is_given_back():
+    controller = batch_controller()
+    with controller.reserve("account").active():
+        pass  # e.g. the job joined a scrape of the same account that was already running
+    assert controller.stats()["reserved"] == 0
+    controller.reserve("account")
+    controller.reserve("account")
+
+def test_unreserved_acquire_still_times_out():
+    async def scenario():
+        controller = batch_controller()
+        first = asyncio.create_task(run_job(controller, controller.reserve("batch"), "batch", 0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit("batch"):
+                pass
+        assert rejected.value.status_code == 503
+        await first
+
+    asyncio.run(scenario())
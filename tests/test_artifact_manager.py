@@ -0,0 +1,63 @@
+import gzip
+import pytest
+from artifact_manager import ArtifactManifest
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = ArtifactManifest(str(tmp_path / "artifacts.sqlite3"))
+    yield manifest
+    manifest.close()
+
+def write_page(directory, name: str, html: str = "<html>club</html>", siblings: bool = False) -> str:
+    path = directory / name
+    path.write_text(html, encoding="utf-8")
+    if siblings:
+        (directory / (name + ".gz")).write_bytes(gzip.compress(html.encode("utf-8")))
+        (directory / (name + ".br")).write_bytes(b"br")
+    return str(path)
+
+def test_recorded_artifacts_round_trip(manifest, tmp_path):
+    older = write_page(tmp_path, "cms_20250101000000_club.html", "<html>1</html>")
+    newer = write_page(tmp_path, "cms_20250102000000_club.html", "<html>2</html>")
+    assert manifest.record(older, "page", "club", created_at=100) == (older, False)
+    assert manifest.record(newer, "page", "club", created_at=200) == (newer, False)
+    entry = manifest.get("cms_20250102000000_club.html")
+    assert entry["path"] == newer
+    assert entry["kind"] == "page" and entry["account"] == "club"
+    assert entry["size"] == len("<html>2</html>")
+    assert [row["path"] for row in manifest.list("club", "page")] == [newer, older]
+    assert manifest.latest("club", "page")["path"] == newer
+    assert manifest.latest("other", "page") is None
+
+def test_identical_artifact_is_deduplicated(manifest, tmp_path):
+    first = write_page(tmp_path, "cms_20250101000000_club.html")
+    second = write_page(tmp_path, "cms_20250102000000_club.html", siblings=True)
+    manifest.record(first, "page", "club")
+    assert manifest.record(second, "page", "club") == (first, True)
+    assert not (tmp_path / "cms_20250102000000_club.html").exists()
+    assert not (tmp_path / "cms_20250102000000_club.html.gz").exists()
+    # The same content for another account is its own artifact.
+    other = write_page(tmp_path, "cms_20250103000000_other.html")
+    assert manifest.record(other, "page", "other") == (other, False)
+
+def test_compact_keeps_the_newest_per_account_and_kind(manifest, tmp_path):
+    paths = [
+        write_page(tmp_path, f"cms_2025010{day}000000_club.html", f"<html>{day}</html>", siblings=True)
+        for day in range(1, 5)
+    ]
+    for day, path in enumerate(paths):
+        manifest.record(path, "page", "club", created_at=day + 1)
+    other = write_page(tmp_path, "cms_20250101000000_other.html", "<html>other</html>")
+    manifest.record(other, "page", "other", created_at=1)
+    missing = write_page(tmp_path, "cms_20250105000000_gone.html", "<html>gone</html>")
+    manifest.record(missing, "page", "gone")
+    (tmp_path / "cms_20250105000000_gone.html").unlink()
+
+    assert manifest.compact(keep=2) == {"deleted": 2, "forgotten": 1}
+    assert [row["path"] for row in manifest.list("club")] == [paths[3], paths[2]]
+    assert manifest.latest("other", "page")["path"] == other
+    assert manifest.get("cms_20250105000000_gone.html") is None
+    for path in paths[:2]:
+        for suffix in ("", ".gz", ".br"):
+            assert not (tmp_path / (path.split("/")[-1] + suffix)).exists()
+    assert (tmp_path / "cms_20250104000000_club.html.br").exists()
@@ -0,0 +1,60 @@
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from upload_utils import AsyncImageDownloader, ImageUploader
+
+CHUNKS = 20
+CHUNK_DELAY = 0.05
+
+class TricklingCDN(BaseHTTPRequestHandler):
+    # Sends a byte every CHUNK_DELAY seconds: each read is well within the request timeout,
+    # the whole body takes CHUNKS * CHUNK_DELAY seconds.
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(CHUNKS))
+        self.end_headers()
+        try:
+            for _ in range(CHUNKS):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(CHUNK_DELAY)
+        except OSError:
+            pass  # the client gave up
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def cdn_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TricklingCDN)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/image.jpg"
+    server.shutdown()
+    server.server_close()
+
+def test_download_fails_once_the_whole_transfer_exceeds_its_timeout(cdn_url):
+    uploader = ImageUploader(retries=0, stream=False)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        uploader.download(cdn_url, timeout=0.3)
+    assert time.monotonic() - start < CHUNKS * CHUNK_DELAY
+    assert uploader.download(cdn_url, timeout=5) == (b"x" * CHUNKS, "image/jpeg")
+    uploader.close()
+
+def test_async_download_fails_once_the_whole_transfer_exceeds_its_timeout(cdn_url):
+    async def scenario():
+        downloader = AsyncImageDownloader(retries=0)
+        try:
+            start = time.monotonic()
+            with pytest.raises(TimeoutError):
+                await downloader.download(cdn_url, timeout=0.3)
+            assert time.monotonic() - start < CHUNKS * CHUNK_DELAY
+            assert await downloader.download(cdn_url, timeout=5) == (b"x" * CHUNKS, "image/jpeg")
+        finally:
+            await downloader.close()
+
+    asyncio.run(scenario())
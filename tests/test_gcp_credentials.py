@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import retrieve_gcp_creds
+from upload_utils import ImageUploader
+
+def service_account_secret(key_id: str) -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return json.dumps({
+        "type": "service_account",
+        "project_id": "test-project",
+        "private_key_id": key_id,
+        "private_key": pem,
+        "client_email": "uploader@test-project.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+
+class FakeSecretsManager:
+    """Stands in for get_secret: returns the current secret and counts the round trips."""
+
+    def __init__(self, secret: str):
+        self.secret = secret
+        self.fetches = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def get_secret(self) -> str:
+        self.fetches += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.secret
+
+@pytest.fixture
+def secrets(monkeypatch):
+    secrets = FakeSecretsManager(service_account_secret("key-1"))
+    monkeypatch.setattr(retrieve_gcp_creds, "get_secret", secrets.get_secret)
+    monkeypatch.setattr(retrieve_gcp_creds, "_credentials", None)
+    monkeypatch.setenv("GCP_CREDS_SOURCE", "secretsmanager")
+    return secrets
+
+def expire_credentials():
+    fetched_at = time.monotonic() - retrieve_gcp_creds.GCP_CREDS_TTL - 1
+    retrieve_gcp_creds._credentials = retrieve_gcp_creds._credentials[:2] + (fetched_at,) + retrieve_gcp_creds._credentials[3:]
+
+def test_unchanged_secret_keeps_the_gcs_client(secrets):
+    uploader = ImageUploader()
+    client = uploader.bucket("bucket")._client
+    expire_credentials()
+    assert uploader.bucket("bucket")._client is client
+    assert secrets.fetches == 2
+    uploader.close()
+
+def test_rotated_key_replaces_the_client_without_closing_it(secrets, monkeypatch):
+    uploader = ImageUploader()
+    old_client = uploader.bucket("bucket")._client
+    closed = []
+    monkeypatch.setattr(old_client, "close", lambda: closed.append(old_client))
+
+    secrets.secret = service_account_secret("key-2")
+    expire_credentials()
+    new_client = uploader.bucket("bucket")._client
+    assert new_client is not old_client
+    # Uploads still running through the old client's blobs must not lose their connection pool.
+    assert closed == []
+    uploader.close()
+    assert closed == [old_client]
+
+def test_refresh_does_not_block_other_threads(secrets):
+    uploader = ImageUploader()
+    uploader.bucket("bucket")
+    expire_credentials()
+
+    secrets.release.clear()
+    secrets.started.clear()
+    refresher = threading.Thread(target=uploader.bucket, args=("bucket",))
+    refresher.start()
+    assert secrets.started.wait(5)
+    # The refresh is stuck in Secrets Manager: other threads get the cached credentials meanwhile.
+    other = threading.Thread(target=uploader.bucket, args=("other-bucket",))
+    other.start()
+    other.join(2)
+    assert not other.is_alive()
+    assert secrets.fetches == 2
+    secrets.release.set()
+    refresher.join(5)
+    uploader.close()
@@ -0,0 +1,65 @@
+import time
+import asyncio
+import pytest
+from jobs import Job, JobQueue, InMemoryJobStore, SQLiteJobStore
+
+def finished_job(finished_at: float) -> Job:
+    return Job(instagram_url="https://www.instagram.com/club/", status="done", finished_at=finished_at)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make_store(**settings):
+        if request.param == "memory":
+            return InMemoryJobStore(**settings)
+        return SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), **settings)
+    return make_store
+
+def test_finished_jobs_expire_after_ttl(make_store):
+    store = make_store(ttl=60)
+    old = finished_job(time.time() - 120)
+    store.save(old)
+    recent = finished_job(time.time())
+    store.save(recent)
+    assert store.get(old.id) is None
+    assert store.get(recent.id) is not None
+
+def test_finished_jobs_are_capped_oldest_first(make_store):
+    store = make_store(max_finished=3)
+    running = Job(instagram_url="https://www.instagram.com/club/", status="running")
+    store.save(running)
+    now = time.time()
+    jobs = [finished_job(now - 10 + i) for i in range(5)]
+    for job in jobs:
+        store.save(job)
+    assert [store.get(job.id) is not None for job in jobs] == [False, False, True, True, True]
+    # Jobs still running are never evicted.
+    assert store.get(running.id) is not None
+
+def test_stages_are_saved_while_the_job_runs(make_store):
+    store = make_store()
+
+    async def scenario():
+        first_stage_done = asyncio.Event()
+        resume = asyncio.Event()
+
+        async def runner(job):
+            with job.stage("apify_run"):
+                pass
+            first_stage_done.set()
+            await resume.wait()
+            return {}
+
+        queue = JobQueue(runner, store=store, workers=1)
+        queue.start()
+        job = queue.submit(Job(instagram_url="https://www.instagram.com/club/"))
+        await first_stage_done.wait()
+        # Read back from the store, as /jobs/{id} does.
+        saved = queue.get(job.id)
+        assert saved.status == "running"
+        assert "apify_run" in saved.stages
+        resume.set()
+        while queue.get(job.id).status != "done":
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(scenario())
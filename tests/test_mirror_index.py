@@ -0,0 +1,68 @@
+import pytest
+from mirror_index import MirrorIndex, source_hash
+
+IMAGE = "https://scontent.cdninstagram.com/v/t51/123_n.jpg?stp=dst-jpg&_nc_ohc=abc&oe=67B"
+# The same file with a freshly signed query string, as a later scrape returns it.
+IMAGE_RESIGNED = "https://scontent.cdninstagram.com/v/t51/123_n.jpg?stp=dst-jpg&_nc_ohc=xyz&oe=68C"
+PUBLIC_URL = "https://storage.googleapis.com/club-bucket/images/1.jpg"
+
+class FakeBlob:
+    def __init__(self, name, metadata=None):
+        self.name = name
+        self.metadata = metadata
+
+class FakeBucket:
+    name = "club-bucket"
+
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def list_blobs(self, prefix):
+        return [blob for blob in self.blobs if blob.name.startswith(prefix)]
+
+@pytest.fixture
+def index(tmp_path):
+    index = MirrorIndex(str(tmp_path / "mirror_index.sqlite3"))
+    yield index
+    index.close()
+
+def test_recorded_mirror_is_found_under_a_resigned_url(index):
+    assert index.lookup("club-bucket", "1", IMAGE) is None
+    index.record("club-bucket", 1, IMAGE, "images/1.jpg", PUBLIC_URL, srcset="1.jpg 640w")
+    assert index.lookup("club-bucket", "1", IMAGE_RESIGNED) == (PUBLIC_URL, "1.jpg 640w")
+    # Other buckets, posts and files are separate entries.
+    assert index.lookup("other-bucket", "1", IMAGE) is None
+    assert index.lookup("club-bucket", "2", IMAGE) is None
+    assert index.lookup("club-bucket", "1", "https://scontent.cdninstagram.com/v/t51/456_n.jpg") is None
+
+def test_record_replaces_the_earlier_entry(index):
+    index.record("club-bucket", "1", IMAGE, "images/1.jpg", PUBLIC_URL)
+    index.record("club-bucket", "1", IMAGE_RESIGNED, "images/1-v2.jpg", PUBLIC_URL + "?v2")
+    assert index.lookup("club-bucket", "1", IMAGE) == (PUBLIC_URL + "?v2", None)
+
+def test_index_survives_reopening(tmp_path):
+    path = str(tmp_path / "mirror_index.sqlite3")
+    first = MirrorIndex(path)
+    first.record("club-bucket", "1", IMAGE, "images/1.jpg", PUBLIC_URL)
+    first.record_variants("club-bucket", "sha", "1-320.webp 320w")
+    first.close()
+    reopened = MirrorIndex(path)
+    assert reopened.lookup("club-bucket", "1", IMAGE) == (PUBLIC_URL, None)
+    assert reopened.lookup_variants("club-bucket", "sha") == "1-320.webp 320w"
+    reopened.close()
+
+def test_reconcile_drops_deleted_blobs_and_adds_other_instances_uploads(index):
+    index.record("club-bucket", "1", IMAGE, "images/1.jpg", PUBLIC_URL)
+    index.record("club-bucket", "2", IMAGE, "images/2.jpg", PUBLIC_URL)
+    other = "https://scontent.cdninstagram.com/v/t51/789_n.mp4"
+    bucket = FakeBucket([
+        FakeBlob("images/1.jpg", {"item-id": "1"}),
+        FakeBlob("videos/3.mp4", {"item-id": "3", "source-hash": source_hash(other)}),
+        FakeBlob("images/unrelated.jpg"),
+    ])
+    assert index.reconcile(bucket) == (1, 1)
+    assert index.lookup("club-bucket", "1", IMAGE) == (PUBLIC_URL, None)
+    assert index.lookup("club-bucket", "2", IMAGE) is None
+    assert index.lookup("club-bucket", "3", other) == (
+        "https://storage.googleapis.com/club-bucket/videos/3.mp4", None
+    )
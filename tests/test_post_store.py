@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import main
+from post_store import PostStore
+
+URL = "https://www.instagram.com/club/"
+
+def post(post_id: str, timestamp: str) -> dict:
+    return {"id": post_id, "timestamp": timestamp}
+
+def test_merge_is_stored_with_the_snapshot(tmp_path):
+    store = PostStore(str(tmp_path))
+    posts, changed = store.merge("club", [post("2", "2025-02-02T00:00:00.000Z"), post("1", "2025-02-01T00:00:00.000Z")])
+    assert changed
+    assert store.newest_timestamp("club") is None
+    store.set_snapshot("club", "scraped_data_club.jsonl.gz", posts)
+    assert store.newest_timestamp("club") == "2025-02-02T00:00:00"
+    assert store.merge("club", [post("2", "2025-02-02T00:00:00.000Z")]) == (posts, False)
+
+def test_failed_snapshot_write_leaves_the_stored_posts_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = PostStore(str(tmp_path / "post_store"))
+    store.set_snapshot("club", "scraped_data_old.jsonl.gz", [post("1", "2025-02-01T00:00:00.000Z")])
+
+    async def run_instagram_scraper(instagram_url, results_limit=12, newer_than=None):
+        return {"defaultDatasetId": "dataset"}
+
+    async def iterate_dataset_pages(dataset_id):
+        yield [{"id": "2", "timestamp": "2025-02-02T00:00:00.000Z"}]
+
+    def write_posts(f, posts):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "post_store", store)
+    monkeypatch.setattr(main, "run_instagram_scraper", run_instagram_scraper)
+    monkeypatch.setattr(main, "iterate_dataset_pages", iterate_dataset_pages)
+    monkeypatch.setattr(main, "write_posts", write_posts)
+    monkeypatch.setattr(main, "get_search_index", lambda: None)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(main.run_apify_and_write_to_file(URL, incremental=True))
+    # The next incremental run still asks for post 2.
+    assert store.newest_timestamp("club") == "2025-02-01T00:00:00"
+    assert store.load("club")["snapshot"] == "scraped_data_old.jsonl.gz"
+
+def test_directory_is_created_on_first_write(tmp_path):
+    store = PostStore(str(tmp_path / "post_store"))
+    assert store.newest_timestamp("club") is None
+    assert not (tmp_path / "post_store").exists()
+    store.set_snapshot("club", "scraped_data_club.jsonl.gz")
+    assert (tmp_path / "post_store" / "club.json").exists()
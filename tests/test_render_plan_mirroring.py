@@ -0,0 +1,76 @@
+import os
+import asyncio
+import pytest
+import generate_cms
+from generate_cms import load_posts, render_plan, mirror_images, mirror_images_async
+from mirror_index import MirrorIndex
+from upload_utils import public_url
+from conftest import REPO_DIR
+
+# 12 posts: 3 landing posts and 9 gallery posts with 23 child posts; the landing posts have 11 more.
+FIXTURE = os.path.join(REPO_DIR, "static", "scraped_data_20250224172444.json")
+BUCKET = "test-bucket"
+
+class FakeBucket:
+    """Stands in for upload_image_to_gcs: records every transfer instead of talking to GCS."""
+
+    def __init__(self):
+        self.transfers = []
+
+    def upload(self, image_url, bucket_name, destination_blob_name, timeout=None, metadata=None):
+        self.transfers.append(destination_blob_name)
+        return public_url(bucket_name, destination_blob_name)
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(generate_cms, "upload_image_to_gcs", bucket.upload)
+    # Variants would download through the real uploader; the plain transfer path is what is counted here.
+    monkeypatch.setattr(generate_cms, "IMAGE_VARIANTS", False)
+    return bucket
+
+def all_media(posts):
+    return [item for post in posts for item in [post] + post.child_posts]
+
+def test_render_plan_skips_landing_child_posts():
+    posts = load_posts(FIXTURE)
+    above_fold, below_fold = render_plan(posts)
+    assert above_fold == posts[:3]
+    assert len(above_fold) + len(below_fold) == 35
+    assert len(all_media(posts)) == 46
+    for post in posts[:3]:
+        assert not any(child in below_fold for child in post.child_posts)
+
+def test_mirror_images_transfers_only_rendered_images(bucket, tmp_path):
+    index = MirrorIndex(str(tmp_path / "mirror_index.sqlite3"))
+    above_fold, below_fold = render_plan(load_posts(FIXTURE))
+    mirror_images(above_fold, BUCKET, index=index)
+    mirror_images(below_fold, BUCKET, index=index)
+
+    assert len(bucket.transfers) == 35
+    assert sorted(bucket.transfers) == sorted(f"images/{item.id}.jpg" for item in above_fold + below_fold)
+    assert all(item.proxy_image == public_url(BUCKET, f"images/{item.id}.jpg") for item in above_fold + below_fold)
+
+def test_second_run_makes_no_transfers(bucket, tmp_path):
+    index = MirrorIndex(str(tmp_path / "mirror_index.sqlite3"))
+    above_fold, below_fold = render_plan(load_posts(FIXTURE))
+    mirror_images(above_fold + below_fold, BUCKET, index=index)
+    assert len(bucket.transfers) == 35
+
+    # A fresh load of the same snapshot, as the next scrape would do.
+    above_fold, below_fold = render_plan(load_posts(FIXTURE))
+    mirror_images(above_fold, BUCKET, index=index)
+    mirror_images(below_fold, BUCKET, index=index, defer=True)
+    assert len(bucket.transfers) == 35
+    assert all(item.proxy_image == public_url(BUCKET, f"images/{item.id}.jpg") for item in above_fold + below_fold)
+
+def test_async_mirroring_streams_without_variants(bucket, tmp_path, monkeypatch):
+    def buffered_download():
+        raise AssertionError("images without variants must use the streaming upload")
+
+    monkeypatch.setattr(generate_cms, "get_async_downloader", buffered_download)
+    index = MirrorIndex(str(tmp_path / "mirror_index.sqlite3"))
+    above_fold, below_fold = render_plan(load_posts(FIXTURE))
+    asyncio.run(mirror_images_async(above_fold + below_fold, BUCKET, index=index))
+    assert len(bucket.transfers) == 35
+    assert all(item.proxy_image == public_url(BUCKET, f"images/{item.id}.jpg") for item in above_fold + below_fold)
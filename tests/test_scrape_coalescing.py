@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+import main
+from admission import AdmissionController
+from jobs import Job, JobQueue, InMemoryJobStore
+from post_store import account_key
+from scrape_cache import SingleFlightCache
+
+URL = "https://www.instagram.com/club/"
+
+@pytest.fixture
+def actor_runs(monkeypatch):
+    # Like actor_admission: one run at a time per account, one more may wait. The page build only
+    # takes the actor slot and records the run, so only submit/run_scrape_job are under test.
+    runs = []
+    controller = AdmissionController("actor_runs", limit=8, per_key_limit=1, max_queue=32, max_wait=0.05)
+
+    async def build_cms_page(instagram_url, results_limit=12, timer=None):
+        async with controller.admit(account_key(instagram_url)):
+            runs.append(instagram_url)
+            await asyncio.sleep(0.1)
+        return {"cms_page": "page.html"}
+
+    monkeypatch.setattr(main, "actor_admission", controller)
+    monkeypatch.setattr(main, "build_cms_page", build_cms_page)
+    monkeypatch.setattr(main, "page_cache", SingleFlightCache())
+    monkeypatch.setattr(main, "dataset_cache", SingleFlightCache())
+    monkeypatch.setattr(main, "job_queue", JobQueue(main.run_scrape_job, store=InMemoryJobStore(), workers=4))
+    return runs
+
+def submit(url: str = URL) -> Job:
+    return main.submit_scrape_job(Job(instagram_url=url, results_limit=12), account_key(url))
+
+async def wait_for(jobs):
+    while any(main.job_queue.get(job.id).status not in ("done", "failed") for job in jobs):
+        await asyncio.sleep(0.01)
+
+def test_concurrent_scrapes_of_one_account_share_one_actor_run(actor_runs):
+    async def scenario():
+        main.job_queue.start()
+        try:
+            # Without coalescing-aware reservations the third submit was turned away with 429.
+            jobs = [submit() for _ in range(6)]
+            assert main.actor_admission.stats()["reserved"] == 1
+            await wait_for(jobs)
+            # Joining later, while the page is cached, needs no actor place either.
+            late = submit()
+            await wait_for([late])
+        finally:
+            await main.job_queue.stop()
+        assert [main.job_queue.get(job.id).status for job in jobs + [late]] == ["done"] * 7
+        assert actor_runs == [URL]
+        assert main.actor_admission.stats()["reserved"] == 0
+        assert main.reserved_scrapes == {}
+
+    asyncio.run(scenario())
+
+def test_job_accepted_while_the_scrape_runs_takes_no_actor_place(actor_runs):
+    async def scenario():
+        main.job_queue.start()
+        try:
+            first = submit()
+            await asyncio.sleep(0.02)
+            # The first scrape is running: a same-key job accepted now starts no run of its own.
+            second = submit()
+            assert main.actor_admission.stats()["reserved"] == 0
+            await wait_for([first, second])
+        finally:
+            await main.job_queue.stop()
+        assert actor_runs == [URL]
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import gzip
+import json
+import pytest
+from search_index import SearchIndex
+
+def raw_item(post_id: str, timestamp: str, caption: str, **fields) -> dict:
+    return {"id": post_id, "ownerUsername": "BijouBoston", "timestamp": timestamp, "caption": caption,
+            "shortCode": f"code{post_id}", **fields}
+
+ITEMS = [
+    raw_item("1", "2025-02-01T22:00:00.000Z", "Rooftop party tonight #House @djsam",
+             locationName="Bijou Boston", taggedUsers=[{"username": "djsam"}]),
+    raw_item("2", "2025-02-02T22:00:00.000Z", "Terrace season opens #house #techno"),
+    raw_item("3", "2025-02-03T22:00:00.000Z", "Closing set on the terrace #techno"),
+]
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search_index.sqlite3"))
+    yield index
+    index.close()
+
+def ids(result: dict) -> list:
+    return [post["id"] for post in result["results"]]
+
+def test_ingested_posts_are_found_by_text_and_terms(index):
+    assert index.ingest_items(ITEMS, "scraped_data_club.jsonl.gz") == 3
+    assert ids(index.search(q="terrace")) == ["3", "2"]
+    assert ids(index.search(q="rooftop OR closing")) == ["3", "1"]
+    assert ids(index.search(hashtag="house")) == ["2", "1"]
+    assert ids(index.search(hashtag="house,techno")) == ["2"]
+    assert ids(index.search(mention="@djsam")) == ["1"]
+    assert ids(index.search(tagged="djsam", location="bijou boston")) == ["1"]
+    assert ids(index.search(account="@bijouboston", since="2025-02-02", until="2025-02-03")) == ["2"]
+    post = index.search(q="rooftop")["results"][0]
+    assert post["hashtags"] == ["house"]
+    assert post["url"] == "https://www.instagram.com/p/code1/"
+    assert post["snapshot"] == "scraped_data_club.jsonl.gz"
+
+def test_pages_follow_the_cursor(index):
+    index.ingest_items(ITEMS)
+    first = index.search(limit=2)
+    assert ids(first) == ["3", "2"]
+    second = index.search(limit=2, cursor=first["next_cursor"])
+    assert ids(second) == ["1"]
+    assert second["next_cursor"] is None
+
+def test_edited_caption_replaces_the_indexed_text(index):
+    index.ingest_items(ITEMS)
+    # The same raw copy again, and a compact copy of it, change nothing.
+    assert index.ingest_items(ITEMS[:1]) == 0
+    assert index.ingest_items([{"id": "1", "owner_username": "bijouboston", "caption": ITEMS[0]["caption"],
+                                "timestamp": ITEMS[0]["timestamp"]}]) == 0
+    assert index.ingest_items([dict(ITEMS[0], caption="Rooftop moved indoors #house")]) == 1
+    assert ids(index.search(q="indoors")) == ["1"]
+    assert ids(index.search(q="party")) == []
+    assert ids(index.search(mention="djsam")) == []
+    assert index.stats()["posts"] == 3
+
+def test_backfill_ingests_each_snapshot_once(index, tmp_path):
+    snapshots = tmp_path / "static"
+    snapshots.mkdir()
+    (snapshots / "scraped_data_20250201000000.json").write_text(json.dumps(ITEMS[:2]), encoding="utf-8")
+    with gzip.open(snapshots / "scraped_data_20250203000000_club.jsonl.gz", "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "3", "owner_username": "bijouboston", "timestamp": ITEMS[2]["timestamp"],
+                            "caption": ITEMS[2]["caption"]}) + "\n")
+    (snapshots / "scraped_data_20250204000000.json").write_text("[{", encoding="utf-8")
+
+    assert index.ingest_directory(str(snapshots)) == 3
+    assert index.ingest_directory(str(snapshots)) == 0
+    assert index.stats() == {"posts": 3, "terms": 7, "files": 2}
+    assert ids(index.search(hashtag="techno")) == ["3", "2"]
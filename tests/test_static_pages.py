@@ -0,0 +1,60 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+import main
+from static_pages import IMMUTABLE_CACHE_CONTROL, publish_page
+
+PAGE = "cms_20250224172444.html"
+HTML = "<html><body>" + "<p>club night</p>" * 200 + "</body></html>"
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The app's own /static mount, pointed at a scratch directory.
+    static = next(route for route in main.app.routes if getattr(route, "name", None) == "static")
+    monkeypatch.setattr(static.app, "all_directories", [str(tmp_path)])
+    (tmp_path / PAGE).write_text(HTML, encoding="utf-8")
+    publish_page(str(tmp_path / PAGE))
+    return TestClient(main.app)
+
+def test_page_is_served_precompressed_with_immutable_caching(client):
+    response = client.get(f"/static/{PAGE}", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"].startswith('"') and response.headers["etag"].endswith('-gzip"')
+    assert int(response.headers["content-length"]) < len(HTML)
+    assert response.text == HTML
+
+def test_brotli_is_preferred_and_each_encoding_has_its_own_etag(client):
+    brotli_response = client.get(f"/static/{PAGE}", headers={"accept-encoding": "gzip, br"})
+    identity = client.get(f"/static/{PAGE}", headers={"accept-encoding": "identity"})
+    assert brotli_response.headers["content-encoding"] == "br"
+    assert brotli_response.text == HTML
+    assert "content-encoding" not in identity.headers
+    assert identity.text == HTML
+    assert identity.headers["etag"] == brotli_response.headers["etag"].replace("-br", "")
+
+def test_matching_etag_gets_not_modified(client):
+    etag = client.get(f"/static/{PAGE}", headers={"accept-encoding": "gzip"}).headers["etag"]
+    response = client.get(f"/static/{PAGE}", headers={"accept-encoding": "gzip", "if-none-match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+def test_stale_sibling_is_not_served(client, tmp_path):
+    stat = os.stat(tmp_path / PAGE)
+    os.utime(tmp_path / (PAGE + ".gz"), ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+    response = client.get(f"/static/{PAGE}", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.text == HTML
+
+def test_hand_placed_files_are_revalidated(client, tmp_path):
+    (tmp_path / "style.css").write_text("body { color: black; }", encoding="utf-8")
+    response = client.get("/static/style.css", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "no-cache"
+    assert "content-encoding" not in response.headers
+    assert response.text == "body { color: black; }"
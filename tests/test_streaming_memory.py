@@ -0,0 +1,99 @@
+import sys
+import json
+import subprocess
+from conftest import REPO_DIR
+
+MB = 1024 * 1024
+
+# Runs one upload of a size-byte body in a fresh interpreter and prints its peak RSS, so every
+# size is measured on its own. The CDN response and the bucket are fakes that never hold the
+# whole body: the response produces it on read, the blob consumes it chunk by chunk.
+CHILD = """
+import sys, json, resource
+from upload_utils import ImageUploader
+
+size, stream = int(sys.argv[1]), sys.argv[2] == "1"
+
+class FakeRaw:
+    decode_content = False
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, n=-1):
+        n = self.remaining if n is None or n < 0 else min(n, self.remaining)
+        self.remaining -= n
+        return b"x" * n
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, size):
+        self.headers = {"Content-Type": "video/mp4", "Content-Length": str(size)}
+        self.raw = FakeRaw(size)
+
+    @property
+    def content(self):
+        return self.raw.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeSession:
+    def get(self, url, timeout=None, stream=False):
+        return FakeResponse(size)
+
+    def close(self):
+        pass
+
+class FakeBlob:
+    chunk_size = None
+    metadata = None
+    received = 0
+
+    def upload_from_file(self, f, content_type=None, timeout=None, retry=None):
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                break
+            FakeBlob.received += len(chunk)
+
+    def upload_from_string(self, data, content_type=None, timeout=None, retry=None):
+        FakeBlob.received += len(data)
+
+class FakeBucket:
+    def blob(self, name):
+        return FakeBlob()
+
+uploader = ImageUploader(stream=stream, chunk_size=1024 * 1024, retries=0)
+uploader.session = FakeSession()
+uploader.bucket = lambda bucket_name: FakeBucket()
+uploader.upload("https://cdn.example/video.mp4", "test-bucket", "videos/1.mp4")
+assert FakeBlob.received == size, FakeBlob.received
+try:
+    # ru_maxrss on Linux keeps the peak of the forking parent; VmHWM is this process's own.
+    with open("/proc/self/status") as status:
+        peak = next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+except OSError:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"peak_rss_kb": peak}))
+"""
+
+def peak_rss_mb(size: int, stream: bool) -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", CHILD, str(size), "1" if stream else "0"], cwd=REPO_DIR, text=True
+    )
+    return json.loads(output.strip().splitlines()[-1])["peak_rss_kb"] / 1024
+
+def test_streaming_upload_memory_is_flat_as_size_grows():
+    small, large = peak_rss_mb(8 * MB, stream=True), peak_rss_mb(128 * MB, stream=True)
+    # 16x the body, same memory: only a chunk or two (1 MB each) is held at a time.
+    assert large - small < 8, (small, large)
+
+def test_buffered_upload_memory_grows_with_size():
+    # Control: the non-streaming path holds the whole body, so the measurement above can see growth.
+    small, large = peak_rss_mb(8 * MB, stream=False), peak_rss_mb(128 * MB, stream=False)
+    assert large - small > 100, (small, large)
@@ -1,32 +1,326 @@
 import os
-import requests
-from google.cloud import storage
+import time
+import asyncio
+import logging
+import threading
+from startup_timing import lazy_import
+from metrics import TRANSFER_SECONDS
 
-def upload_image_to_gcs(image_url: str, bucket_name: str, destination_blob_name: str) -> str:
+logger = logging.getLogger(__name__)
+
+GCS_CHUNK_UNIT = 256 * 1024
+# Transient CDN responses worth retrying (with exponential backoff).
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class DeadlineReader:
     """
-    Downloads an image from image_url and uploads it to the specified GCS bucket.
-    Returns the public URL of the uploaded image.
+    File-like view of a download that fails once the whole transfer has taken longer than
+    timeout seconds. Request timeouts only bound each connect/read, so a CDN trickling bytes
+    could otherwise hold a transfer (and its upload slot) indefinitely.
     """
-    # Download the image data
-    response = requests.get(image_url)
-    if response.status_code != 200:
-        raise Exception(f"Failed to download image: {image_url}")
-    image_data = response.content
 
-    # Initialize the GCS client (credentials are taken from GOOGLE_APPLICATION_CREDENTIALS env variable)
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
+    def __init__(self, raw, url: str, timeout: float):
+        self.raw = raw
+        self.url = url
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+
+    def check(self):
+        if time.monotonic() > self.deadline:
+            raise TimeoutError(f"Download of {self.url} took longer than {self.timeout}s")
 
-    # Upload the image data
-    blob.upload_from_string(image_data, content_type=response.headers.get("Content-Type"))
-    print(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"))
+    def read(self, size: int = None) -> bytes:
+        self.check()
+        return self.raw.read(size)
 
+    def read_all(self, chunk_size: int) -> bytes:
+        chunks = []
+        for chunk in iter(lambda: self.read(chunk_size), b""):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def __getattr__(self, name):
+        # tell() and friends, used by the resumable upload.
+        return getattr(self.raw, name)
+
+def public_url(bucket_name: str, destination_blob_name: str) -> str:
     # Because uniform bucket-level access is enabled, we can’t use legacy ACLs.
     # Ensure your bucket’s IAM policy grants public read (roles/storage.objectViewer for allUsers).
     # Construct the public URL manually:
-    public_url = f"https://storage.googleapis.com/{bucket_name}/{destination_blob_name}"
-    return public_url
+    return f"https://storage.googleapis.com/{bucket_name}/{destination_blob_name}"
+
+def credentials_key(credentials, project: str) -> tuple:
+    # Identifies the service account key, so re-fetching the same secret keeps the GCS client.
+    signer = getattr(credentials, "signer", None)
+    return getattr(credentials, "service_account_email", None), getattr(signer, "key_id", None), project
+
+class ImageUploader:
+    """
+    Long-lived uploader shared by the whole process: holds one pooled HTTP session
+    for the image CDN and one GCS client (with cached bucket handles).
+    Settings default to the UPLOAD_* environment variables.
+    """
+
+    def __init__(self, pool_size: int = None, retries: int = None, backoff: float = None, timeout: float = None,
+                 stream: bool = None, chunk_size: int = None):
+        self.pool_size = pool_size or int(os.environ.get("UPLOAD_POOL_SIZE", "32"))
+        self.retries = retries if retries is not None else int(os.environ.get("UPLOAD_RETRIES", "3"))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("UPLOAD_BACKOFF", "0.5"))
+        self.timeout = timeout or float(os.environ.get("UPLOAD_TIMEOUT", "60"))
+        # Streaming mode pipes the download straight into a chunked GCS upload, so memory
+        # per transfer is bounded by chunk_size instead of the file size.
+        self.stream = stream if stream is not None else os.environ.get("UPLOAD_STREAM", "1") == "1"
+        chunk_size = chunk_size or int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+        # GCS resumable uploads need chunks in multiples of 256 KB.
+        self.chunk_size = max(1, round(chunk_size / GCS_CHUNK_UNIT)) * GCS_CHUNK_UNIT
+
+        # requests and google-cloud-storage are slow to import, so they are loaded with the
+        # first uploader (on first use when the server starts lazily, see main.py).
+        requests = lazy_import("requests")
+        HTTPAdapter = lazy_import("requests.adapters").HTTPAdapter
+        Retry = lazy_import("urllib3.util.retry").Retry
+
+        # Keep-alive session with a connection pool and retry/backoff on transient errors.
+        self.session = requests.Session()
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._HTTPAdapter = HTTPAdapter
+        self._storage_client = None
+        self._credentials_key = None
+        self._retired_clients = []
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, bucket_name: str):
+        """
+        Returns a cached bucket handle, creating the GCS client on first use. With Secrets Manager
+        credentials, the client is replaced when the service account key changes.
+        """
+        credentials, project, key = None, None, None
+        if os.environ.get("GCP_CREDS_SOURCE") == "secretsmanager":
+            # In-memory credentials from AWS Secrets Manager, refreshed after GCP_CREDS_TTL.
+            # Fetched before taking the lock, so a refresh does not hold up other upload threads.
+            from retrieve_gcp_creds import get_google_credentials
+            credentials, project = get_google_credentials()
+            key = credentials_key(credentials, project)
+        with self._lock:
+            if self._storage_client is not None and key != self._credentials_key:
+                # Blobs handed out earlier may still be uploading through the old client, so it
+                # is only closed with the uploader.
+                self._retired_clients.append(self._storage_client)
+                self._storage_client = None
+                self._buckets = {}
+                logger.info("GCP credentials changed, replacing the GCS client")
+            if self._storage_client is None:
+                storage = lazy_import("google.cloud.storage")
+                if credentials is not None:
+                    self._storage_client = storage.Client(project=project, credentials=credentials)
+                    logger.debug("GCS client created with credentials from Secrets Manager")
+                else:
+                    # Credentials are taken from GOOGLE_APPLICATION_CREDENTIALS env variable
+                    self._storage_client = storage.Client()
+                    logger.debug("GCS client created with credentials: %s", os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"))
+                self._credentials_key = key
+                # Size the GCS connection pool like the download pool (http:// for STORAGE_EMULATOR_HOST).
+                adapter = self._HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                self._storage_client._http.mount("https://", adapter)
+                self._storage_client._http.mount("http://", adapter)
+            if bucket_name not in self._buckets:
+                self._buckets[bucket_name] = self._storage_client.bucket(bucket_name)
+            return self._buckets[bucket_name]
+
+    def upload(self, image_url: str, bucket_name: str, destination_blob_name: str, timeout: float = None,
+               metadata: dict = None) -> str:
+        """
+        Downloads an image (or video) from image_url and uploads it to the specified GCS bucket,
+        attaching metadata (if given) as custom object metadata.
+        Returns the public URL of the uploaded file.
+        """
+        timeout = timeout or self.timeout
+        blob = self.bucket(bucket_name).blob(destination_blob_name)
+        if metadata:
+            blob.metadata = metadata
+
+        if self.stream:
+            # Download and upload overlap, so they are timed together.
+            with TRANSFER_SECONDS.time(op="transfer"):
+                self._upload_streaming(image_url, blob, timeout)
+        else:
+            # Download the image data
+            image_data, content_type = self.download(image_url, timeout)
+
+            # Upload the image data
+            with TRANSFER_SECONDS.time(op="upload"):
+                blob.upload_from_string(
+                    image_data,
+                    content_type=content_type,
+                    timeout=timeout,
+                    retry=self._upload_retry(),
+                )
+
+        return public_url(bucket_name, destination_blob_name)
+
+    def download(self, url: str, timeout: float = None) -> tuple:
+        """Downloads url into memory. Returns (data, content type)."""
+        timeout = timeout or self.timeout
+        with TRANSFER_SECONDS.time(op="download"):
+            with self.session.get(url, timeout=timeout, stream=True) as response:
+                reader = DeadlineReader(response.raw, url, timeout)
+                if response.status_code != 200:
+                    raise Exception(f"Failed to download image: {url}")
+                response.raw.decode_content = True
+                return reader.read_all(GCS_CHUNK_UNIT), response.headers.get("Content-Type")
+
+    def upload_bytes(self, data: bytes, bucket_name: str, destination_blob_name: str, content_type: str = None,
+                     timeout: float = None, metadata: dict = None) -> str:
+        """Uploads data that is already in memory. Returns the public URL of the uploaded file."""
+        blob = self.bucket(bucket_name).blob(destination_blob_name)
+        if metadata:
+            blob.metadata = metadata
+        with TRANSFER_SECONDS.time(op="upload"):
+            blob.upload_from_string(
+                data,
+                content_type=content_type,
+                timeout=timeout or self.timeout,
+                retry=self._upload_retry(),
+            )
+        return public_url(bucket_name, destination_blob_name)
+
+    def _upload_streaming(self, url: str, blob, timeout: float):
+        with self.session.get(url, timeout=timeout, stream=True) as response:
+            reader = DeadlineReader(response.raw, url, timeout)
+            if response.status_code != 200:
+                raise Exception(f"Failed to download image: {url}")
+            response.raw.decode_content = True
+            content_type = response.headers.get("Content-Type")
+            content_length = int(response.headers.get("Content-Length") or 0)
+
+            if 0 < content_length <= self.chunk_size:
+                # Small files fit in one chunk: a single multipart request is cheaper
+                # than starting a resumable session.
+                blob.upload_from_string(
+                    reader.read_all(self.chunk_size),
+                    content_type=content_type,
+                    timeout=timeout,
+                    retry=self._upload_retry(),
+                )
+                return
+
+            # Large or unknown-size files go through a resumable upload fed chunk by chunk
+            # from the socket. The response stream can't be rewound, so no upload retry here.
+            blob.chunk_size = self.chunk_size
+            blob.upload_from_file(reader, content_type=content_type, timeout=timeout, retry=None)
+
+    def _upload_retry(self):
+        return lazy_import("google.cloud.storage.retry").DEFAULT_RETRY if self.retries else None
+
+    def close(self):
+        self.session.close()
+        for client in self._retired_clients:
+            client.close()
+        if self._storage_client is not None:
+            self._storage_client.close()
+
+# Process-wide uploader, created at FastAPI startup (or lazily on first upload).
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def init_uploader(**settings) -> ImageUploader:
+    """Creates the process-wide uploader. Call once at startup."""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = ImageUploader(**settings)
+        return _uploader
+
+def get_uploader() -> ImageUploader:
+    return _uploader or init_uploader()
+
+def close_uploader():
+    global _uploader
+    with _uploader_lock:
+        if _uploader is not None:
+            _uploader.close()
+            _uploader = None
+
+class AsyncImageDownloader:
+    """
+    Pooled async HTTP client for CDN downloads from the event loop, so a download waiting on
+    the network holds no thread. Uses the same UPLOAD_* settings and retry policy as ImageUploader.
+    """
+
+    def __init__(self, pool_size: int = None, retries: int = None, backoff: float = None, timeout: float = None):
+        self.pool_size = pool_size or int(os.environ.get("UPLOAD_POOL_SIZE", "32"))
+        self.retries = retries if retries is not None else int(os.environ.get("UPLOAD_RETRIES", "3"))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("UPLOAD_BACKOFF", "0.5"))
+        self.timeout = timeout or float(os.environ.get("UPLOAD_TIMEOUT", "60"))
+        httpx = lazy_import("httpx")
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self.client = httpx.AsyncClient(
+            # Transport retries cover connection errors; status retries are handled in download().
+            transport=httpx.AsyncHTTPTransport(limits=limits, retries=self.retries),
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+    async def download(self, url: str, timeout: float = None) -> tuple:
+        """
+        Downloads url into memory. Returns (data, content type).
+        timeout bounds the whole download, retries included, as well as each request.
+        """
+        timeout = timeout or self.timeout
+        with TRANSFER_SECONDS.time(op="download"):
+            try:
+                return await asyncio.wait_for(self._download(url, timeout), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Download of {url} took longer than {timeout}s") from None
+
+    async def _download(self, url: str, timeout: float) -> tuple:
+        for attempt in range(self.retries + 1):
+            response = await self.client.get(url, timeout=timeout)
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            if response.status_code != 200:
+                raise Exception(f"Failed to download image: {url}")
+            return response.content, response.headers.get("Content-Type")
+
+    async def close(self):
+        await self.client.aclose()
+
+# Process-wide async downloader. An httpx client is tied to its event loop, so a new one is
+# made when called from a different loop (e.g. a second asyncio.run in a CLI).
+_downloader = None
+_downloader_loop = None
+
+def get_async_downloader() -> AsyncImageDownloader:
+    global _downloader, _downloader_loop
+    loop = asyncio.get_running_loop()
+    if _downloader is None or _downloader_loop is not loop:
+        _downloader, _downloader_loop = AsyncImageDownloader(), loop
+    return _downloader
+
+async def close_async_downloader():
+    global _downloader, _downloader_loop
+    if _downloader is not None:
+        downloader, _downloader, _downloader_loop = _downloader, None, None
+        await downloader.close()
+
+def upload_image_to_gcs(image_url: str, bucket_name: str, destination_blob_name: str, timeout: float = None,
+                        metadata: dict = None) -> str:
+    """
+    Downloads an image from image_url and uploads it to the specified GCS bucket
+    using the shared uploader. Returns the public URL of the uploaded image.
+    """
+    return get_uploader().upload(image_url, bucket_name, destination_blob_name, timeout=timeout, metadata=metadata)
 
 if __name__ == "__main__":
     bucket_name = os.environ.get("GCS_BUCKET_NAME", "your-unique-bucket-name")